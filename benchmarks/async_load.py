@@ -0,0 +1,126 @@
+"""
+Load test comparing the sync WSGI server (gunicorn, as in the Procfile) with
+the ASGI entry point (uvicorn asgi:application) on the same database.
+
+Both servers are started on local ports, then hit with --concurrency requests
+in flight at a time until --requests are done. Prints throughput and latency
+percentiles for each mode.
+
+    python benchmarks/async_load.py --rows 5000 --concurrency 200 --requests 5000
+
+`{n}` in --path is replaced by a random row id so most requests miss the
+response cache. Pass --database-url to run against Postgres instead of a
+temporary SQLite file (it is seeded by dataset.py only when its people
+table is empty).
+"""
+import argparse
+import asyncio
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SRC = os.path.join(ROOT, 'src')
+sys.path.insert(0, SRC)
+
+def seed(database_url, rows):
+    os.environ['DATABASE_URL'] = database_url
+    from app import app
+    from dataset import ensure_seeded
+    ensure_seeded(app, rows)
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def start_server(mode, port, workers, env):
+    if mode == 'wsgi':
+        command = ['gunicorn', 'wsgi', '--chdir', SRC, '--workers', str(workers), '--bind', f'127.0.0.1:{port}']
+    else:
+        command = ['uvicorn', 'asgi:application', '--app-dir', SRC, '--workers', str(workers),
+                   '--port', str(port), '--log-level', 'warning']
+    process = subprocess.Popen(command, env=env, cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return process
+        except OSError:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError(f'{mode} server did not start')
+
+async def get(port, path):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write(f'GET {path} HTTP/1.1\r\nHost: localhost\r\nConnection: close\r\n\r\n'.encode())
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    await reader.read()
+    writer.close()
+    return status
+
+async def run_load(port, make_path, total, concurrency):
+    """
+    Sends `total` GET requests, `concurrency` at a time, to the paths returned
+    by make_path(). Returns the latencies, the number of non-200 answers and
+    the elapsed time.
+    """
+    latencies, errors = [], 0
+    pending = iter(range(total))
+
+    async def worker():
+        nonlocal errors
+        for _ in pending:
+            start = time.perf_counter()
+            try:
+                status = await get(port, make_path())
+            except OSError:
+                status = None
+            latencies.append(time.perf_counter() - start)
+            if status != 200:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, errors, time.perf_counter() - start
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=5000)
+    parser.add_argument('--requests', type=int, default=5000)
+    parser.add_argument('--concurrency', type=int, default=200)
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--path', default='/people?limit=20&after={n}')
+    parser.add_argument('--database-url')
+    parser.add_argument('--modes', default='wsgi,asgi')
+    args = parser.parse_args()
+
+    database_url = args.database_url or f'sqlite:///{tempfile.mkdtemp()}/load.db'
+    seed(database_url, args.rows)
+    env = dict(os.environ, DATABASE_URL=database_url, PYTHONWARNINGS='ignore')
+
+    print(f'{args.requests} requests, {args.concurrency} in flight, {args.workers} workers, GET {args.path}')
+    print(f"{'mode':<6}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}")
+    for mode in args.modes.split(','):
+        port = free_port()
+        process = start_server(mode, port, args.workers, env)
+        try:
+            make_path = lambda: args.path.format(n=random.randint(1, args.rows))
+            latencies, errors, elapsed = asyncio.run(run_load(port, make_path, args.requests, args.concurrency))
+        finally:
+            process.terminate()
+            process.wait()
+        p50, p95, p99 = (percentile(latencies, q) * 1000 for q in (0.5, 0.95, 0.99))
+        print(f'{mode:<6}{len(latencies) / elapsed:>10,.0f}{p50:>10.1f}{p95:>10.1f}{p99:>10.1f}{errors:>8}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,186 @@
+"""
+Synthetic SWAPI-shaped dataset for the benchmarks, scaled from the number of
+people. The same --people and --seed always produce the same rows.
+
+    python benchmarks/dataset.py --people 100000 --database-url sqlite:////tmp/bench.db
+
+Works on SQLite and Postgres: entity rows go through serializers.deserialize
+(so the numeric shadow columns are filled) and are written with the chunked INSERTs of
+the SWAPI importer, then the favorite counters are recounted and the search
+index is rebuilt when the database has one.
+"""
+import argparse
+import itertools
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'src'))
+
+COLORS = ['blue', 'brown', 'green', 'red', 'yellow', 'black', 'white', 'unknown']
+CLIMATES = ['arid', 'temperate', 'frozen', 'murky', 'tropical', 'windy']
+TERRAINS = ['desert', 'grasslands', 'mountains', 'jungle', 'tundra', 'ocean']
+CREATED = datetime(2014, 12, 9, 13, 50, 51)
+SYLLABLES = ['ka', 'lo', 'ree', 'tan', 'vo', 'shi', 'dar', 'mu', 'zel', 'on', 'bri', 'xa']
+
+def scale(people):
+    """Row counts of every table for a dataset with `people` people."""
+    return {
+        'people': people,
+        'planets': max(10, people // 10),
+        'films': max(6, people // 1000),
+        'species': max(5, people // 50),
+        'starships': max(10, people // 20),
+        'vehicles': max(10, people // 20),
+        'users': max(10, people // 100),
+    }
+
+def word(rng, parts=2):
+    return ''.join(rng.choice(SYLLABLES) for _ in range(parts)).capitalize()
+
+def number(rng, low, high, unknown=0.05):
+    return 'unknown' if rng.random() < unknown else str(rng.randint(low, high))
+
+def _dates(i):
+    stamp = (CREATED + timedelta(minutes=i)).isoformat()
+    return {'created': stamp, 'edited': stamp}
+
+def entity_rows(rng, counts):
+    """Generators of the JSON items of every resource, as the API receives them."""
+    return {
+        'planets': ({
+            'name': f'{word(rng)} {i}', 'diameter': number(rng, 1000, 20000), 'rotation_period': number(rng, 10, 40),
+            'orbital_period': number(rng, 200, 600), 'gravity': '1 standard', 'population': number(rng, 0, 10 ** 9),
+            'climate': rng.choice(CLIMATES), 'terrain': rng.choice(TERRAINS), 'surface_water': number(rng, 0, 100),
+            **_dates(i),
+        } for i in range(counts['planets'])),
+        'films': ({
+            'title': f'{word(rng, 3)} {i}', 'episode_id': i + 1, 'opening_crawl': ' '.join(word(rng) for _ in range(40)),
+            'director': word(rng), 'producer': word(rng), 'release_date': f'{1977 + i % 40}-05-25',
+            **_dates(i),
+        } for i in range(counts['films'])),
+        'species': ({
+            'name': f'{word(rng)} {i}', 'classification': 'mammal', 'designation': 'sentient',
+            'average_height': number(rng, 50, 300), 'average_lifespan': number(rng, 50, 1000),
+            'hair_colors': rng.choice(COLORS), 'skin_colors': rng.choice(COLORS), 'eye_colors': rng.choice(COLORS),
+            'language': word(rng), **_dates(i),
+        } for i in range(counts['species'])),
+        'people': ({
+            'name': f'{word(rng)} {word(rng)} {i}', 'birth_year': f'{rng.randint(1, 900)}BBY',
+            'eye_color': rng.choice(COLORS), 'gender': rng.choice(['male', 'female', 'n/a']),
+            'hair_color': rng.choice(COLORS), 'height': number(rng, 60, 250), 'mass': number(rng, 20, 200, 0.2),
+            'skin_color': rng.choice(COLORS), 'homeworld': f'https://swapi.dev/api/planets/{rng.randint(1, counts["planets"])}/',
+            **_dates(i),
+        } for i in range(counts['people'])),
+        'starships': ({
+            'name': f'{word(rng)} {i}', 'model': word(rng, 3), 'starship_class': 'Starfighter', 'manufacturer': word(rng),
+            'cost_in_credits': number(rng, 10 ** 4, 10 ** 9), 'length': number(rng, 5, 2000), 'crew': '1',
+            'passengers': '0', 'max_atmosphering_speed': number(rng, 100, 1500), 'hyperdrive_rating': '1.0',
+            'MGLT': '100', 'cargo_capacity': number(rng, 0, 10 ** 6), 'consumables': '1 week', **_dates(i),
+        } for i in range(counts['starships'])),
+        'vehicles': ({
+            'name': f'{word(rng)} {i}', 'model': word(rng, 3), 'vehicle_class': 'speeder', 'manufacturer': word(rng),
+            'length': number(rng, 2, 50), 'cost_in_credits': number(rng, 1000, 10 ** 6), 'crew': '1',
+            'passengers': '1', 'max_atmosphering_speed': number(rng, 50, 800), 'cargo_capacity': number(rng, 0, 1000),
+            'consumables': '1 day', **_dates(i),
+        } for i in range(counts['vehicles'])),
+        'users': ({
+            'email': f'user{i}@example.com', 'password': 'benchmark', 'is_active': True,
+        } for i in range(counts['users'])),
+    }
+
+def link_rows(rng, counts):
+    """
+    Generators of id pairs per association table, in the order of the table's
+    columns; every pair appears at most once.
+    """
+    def pick(resource, most):
+        return rng.sample(range(1, counts[resource] + 1), rng.randint(0, min(most, counts[resource])))
+
+    def ids(resource):
+        return range(1, counts[resource] + 1)
+
+    return {
+        'people_films': ((p, f) for p in ids('people') for f in pick('films', 3)),
+        'planets_people': ((rng.randint(1, counts['planets']), p) for p in ids('people')),
+        'species_people': ((rng.randint(1, counts['species']), p) for p in ids('people') if rng.random() < 0.7),
+        'people_starships': ((p, s) for p in ids('people') for s in pick('starships', 1)),
+        'people_vehicles': ((p, v) for p in ids('people') for v in pick('vehicles', 1)),
+        'planets_films': ((p, f) for p in ids('planets') for f in pick('films', 2)),
+        'species_films': ((s, f) for s in ids('species') for f in pick('films', 2)),
+        'starships_films': ((s, f) for s in ids('starships') for f in pick('films', 2)),
+        'vehicles_films': ((v, f) for v in ids('vehicles') for f in pick('films', 2)),
+        'user_favorites_planets': ((u, p) for u in ids('users') for p in pick('planets', 5)),
+        'user_favorites_people': ((u, p) for u in ids('users') for p in pick('people', 5)),
+    }
+
+def insert_chunks(table, rows):
+    """Inserts an iterator of rows CHUNK_SIZE at a time, never holding all of them."""
+    from swapi_import import CHUNK_SIZE, bulk_insert
+    while True:
+        chunk = list(itertools.islice(rows, CHUNK_SIZE))
+        if not chunk:
+            return
+        bulk_insert(table, chunk)
+
+def seed(people, seed=42):
+    """
+    Fills the database of the current app context. Needs empty tables: ids
+    are assumed to start at 1.
+    """
+    import search
+    from favorites import recount_favorites
+    from models import db, User
+    from serializers import deserialize
+    from swapi_import import RESOURCES
+
+    rng = random.Random(seed)
+    counts = scale(people)
+    started = time.perf_counter()
+    items = entity_rows(rng, counts)
+    for resource, model in RESOURCES:
+        rows = (deserialize(model, item, include_hidden=model is User) for item in items[resource])
+        insert_chunks(model.__table__, rows)
+    for name, pairs in link_rows(rng, counts).items():
+        columns = [column.name for column in db.metadata.tables[name].columns]
+        insert_chunks(db.metadata.tables[name], (dict(zip(columns, pair)) for pair in pairs))
+    recount_favorites()
+
+    connection = db.session.connection()
+    if search.backend_for(connection) is not None:
+        search.rebuild(connection)
+    db.session.commit()
+    return counts, time.perf_counter() - started
+
+def ensure_seeded(app, people, seed_value=42):
+    """
+    Creates the schema and seeds it unless the people table already has rows.
+    Returns the row counts of the dataset.
+    """
+    from models import db, People
+    with app.app_context():
+        db.create_all()
+        existing = db.session.query(People.id).count()
+        if existing:
+            return scale(existing)
+        counts, elapsed = seed(people, seed_value)
+        print(f'seeded {sum(counts.values()):,} entities and their links in {elapsed:.1f}s', file=sys.stderr)
+        return counts
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--people', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--database-url', required=True)
+    args = parser.parse_args()
+
+    os.environ['DATABASE_URL'] = args.database_url
+    from app import app
+    counts = ensure_seeded(app, args.people, args.seed)
+    print(counts)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+"""
+Serialization benchmark for the /people and /planets routes.
+
+Compares the old path (hand written to_dict() per row + Flask's default JSON
+provider) with the compiled per-model encoders (+ orjson when installed) and
+prints rows/sec for both.
+
+    python benchmarks/serialization.py --rows 20000 --repeat 5
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'src'))
+
+def legacy_people_to_dict(self):
+    return {
+        'id': self.id,
+        'name': self.name,
+        'birth_year': self.birth_year,
+        'eye_color': self.eye_color,
+        'gender': self.gender,
+        'hair_color': self.hair_color,
+        'height': self.height,
+        'mass': self.mass,
+        'skin_color': self.skin_color,
+        'homeworld': self.homeworld,
+        'created': self.created,
+        'edited': self.edited,
+    }
+
+def legacy_planet_to_dict(self):
+    return {
+        'id': self.id,
+        'name': self.name,
+        'diameter': self.diameter,
+        'rotation_period': self.rotation_period,
+        'orbital_period': self.orbital_period,
+        'gravity': self.gravity,
+        'population': self.population,
+        'climate': self.climate,
+        'terrain': self.terrain,
+        'surface_water': self.surface_water,
+        'created': self.created,
+        'edited': self.edited,
+    }
+
+def seed(db, People, Planet, rows):
+    from datetime import datetime
+    now = datetime(2014, 12, 9, 13, 50, 51)
+    db.session.execute(People.__table__.insert(), [
+        {'name': f'Person {i}', 'birth_year': '19BBY', 'eye_color': 'blue', 'gender': 'male',
+         'hair_color': 'blond', 'height': '172', 'mass': '77', 'skin_color': 'fair',
+         'homeworld': 'https://swapi.dev/api/planets/1/', 'created': now, 'edited': now}
+        for i in range(rows)
+    ])
+    db.session.execute(Planet.__table__.insert(), [
+        {'name': f'Planet {i}', 'diameter': '10465', 'rotation_period': '23', 'orbital_period': '304',
+         'gravity': '1 standard', 'population': '200000', 'climate': 'arid', 'terrain': 'desert',
+         'surface_water': '1', 'created': now, 'edited': now}
+        for i in range(rows)
+    ])
+    db.session.commit()
+
+def measure(client, path, rows, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        response = client.get(path)
+        elapsed = time.perf_counter() - start
+        assert response.status_code == 200, response.status_code
+        best = elapsed if best is None else min(best, elapsed)
+    return rows / best
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=20000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    os.environ['DATABASE_URL'] = f'sqlite:///{workdir}/bench.db'
+    from flask.json.provider import DefaultJSONProvider
+    from app import app
+    from models import db, People, Planet
+    from serializers import SerializerMixin, init_json
+
+    app.config['RESPONSE_CACHE_ENABLED'] = False
+    from cache import response_cache
+    response_cache.enabled = False
+    with app.app_context():
+        db.create_all()
+        seed(db, People, Planet, args.rows)
+
+    client = app.test_client()
+    results = {}
+    for label in ('before', 'after'):
+        if label == 'before':
+            People.to_dict = legacy_people_to_dict
+            Planet.to_dict = legacy_planet_to_dict
+            app.json = DefaultJSONProvider(app)
+        else:
+            People.to_dict = SerializerMixin.to_dict
+            Planet.to_dict = SerializerMixin.to_dict
+            init_json(app)
+        for path in ('/people', '/planets'):
+            results[(label, path)] = measure(client, path, args.rows, args.repeat)
+
+    print(f'{args.rows} rows per table, best of {args.repeat}, JSON provider after: {type(app.json).__name__}')
+    print(f"{'route':<10}{'before rows/s':>16}{'after rows/s':>16}{'speedup':>10}")
+    for path in ('/people', '/planets'):
+        before, after = results[('before', path)], results[('after', path)]
+        print(f'{path:<10}{before:>16,.0f}{after:>16,.0f}{after / before:>9.2f}x')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,284 @@
+"""
+Benchmark suite for the API routes.
+
+Seeds a synthetic dataset (dataset.py) and then:
+
+1. drives every scenario below through the Flask test client, in process,
+   with the response and entity caches off so every request hits the database;
+2. starts the real servers (gunicorn, and uvicorn with --servers wsgi,asgi)
+   and loads the read scenarios over HTTP with --concurrency requests in flight.
+
+For each scenario it reports p50/p95/p99 latency and throughput, plus the peak
+RSS of the benchmark process and of each server. Results can be saved as a
+baseline and later runs compared against it; a p95 more than --tolerance
+(and --min-delta-ms) slower than the baseline is a regression and makes the exit status 1.
+
+    python benchmarks/suite.py --people 10000 --save-baseline benchmarks/baseline.json
+    python benchmarks/suite.py --people 10000 --baseline benchmarks/baseline.json
+
+Only compare runs made on the same machine with the same --people. Routes of
+app.py with no scenario are listed as a warning so new routes get one.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import resource
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'src'))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from async_load import free_port, start_server, run_load, percentile
+from dataset import ensure_seeded
+
+# (endpoint, method, path, JSON body). {people}, {planets}, {films} and the
+# other resource names of dataset.scale() are replaced by a random existing id
+# on every request. Whole table
+# dumps (?stream=1) are "heavy" and run fewer times. Conditional updates
+# (PATCH/PUT) are sent with If-Match: * so they never conflict.
+SCENARIOS = [
+    ('sitemap', 'GET', '/', None),
+    ('handle_hello', 'GET', '/user', None),
+    ('get_people', 'GET', '/people?limit=50', None),
+    ('get_people', 'GET', '/people?limit=50&after={people}', None),
+    ('get_people', 'GET', '/people?sort=-height&limit=50', None),
+    ('get_people', 'GET', '/people?height_gte=180&limit=50', None),
+    ('get_people', 'GET', '/people?name_prefix=Ka&limit=50', None),
+    ('get_people', 'GET', '/people?fields=id,name&limit=500', None),
+    ('get_people', 'GET', '/people?expand=films,starships&limit=50', None),
+    ('get_people', 'GET', '/people?stream=1', None),
+    ('get_people', 'GET', '/people?ids={people},{planets},{vehicles}', None),
+    ('get_person', 'GET', '/people/{people}', None),
+    ('get_person', 'GET', '/people/{people}?expand=films.planets', None),
+    ('update_person', 'PATCH', '/people/{people}', {'height': '181', 'mass': '80'}),
+    ('add_person', 'POST', '/people', {'name': 'Benchmark', 'height': '180'}),
+    ('add_people_bulk', 'POST', '/people/bulk', [{'name': f'Benchmark {i}', 'mass': str(i)} for i in range(100)]),
+    ('get_planets', 'GET', '/planets?limit=50&after={planets}', None),
+    ('get_planets', 'GET', '/planets?sort=-population&limit=50', None),
+    ('get_planets', 'GET', '/planets?stream=1', None),
+    ('get_planet', 'GET', '/planets/{planets}', None),
+    ('update_planet', 'PATCH', '/planets/{planets}', {'population': '2000'}),
+    ('add_planet', 'POST', '/planets', {'name': 'Benchmark', 'population': '1000'}),
+    ('add_planets_bulk', 'POST', '/planets/bulk', [{'name': f'Benchmark {i}'} for i in range(100)]),
+    ('get_vehicles', 'GET', '/vehicles?limit=50&after={vehicles}', None),
+    ('get_vehicle', 'GET', '/vehicles/{vehicles}', None),
+    ('update_vehicle', 'PUT', '/vehicles/{vehicles}', {'name': 'Benchmark', 'length': '12'}),
+    ('add_vehicle', 'POST', '/vehicles', {'name': 'Benchmark'}),
+    ('add_vehicles_bulk', 'POST', '/vehicles/bulk', [{'name': f'Benchmark {i}'} for i in range(100)]),
+    ('get_films', 'GET', '/films', None),
+    ('get_film', 'GET', '/films/{films}?expand=planets', None),
+    ('update_film', 'PATCH', '/films/{films}', {'director': 'Benchmark'}),
+    ('get_starships', 'GET', '/starships?limit=50&after={starships}', None),
+    ('get_starship', 'GET', '/starships/{starships}', None),
+    ('update_starship', 'PATCH', '/starships/{starships}', {'crew': '2'}),
+    ('get_species_list', 'GET', '/species?limit=50&after={species}', None),
+    ('get_species', 'GET', '/species/{species}', None),
+    ('update_species', 'PATCH', '/species/{species}', {'language': 'Benchmark'}),
+    ('get_planet_films_via_residents', 'GET', '/planets/{planets}/films-via-residents', None),
+    ('get_film_homeworlds', 'GET', '/films/{films}/homeworlds', None),
+    ('batch_get', 'POST', '/batch', {'people': list(range(1, 51)), 'planets': list(range(1, 21)), 'films': [1, 2, 3]}),
+    ('get_pool_status', 'GET', '/status/db-pool', None),
+    ('get_metrics', 'GET', '/metrics', None),
+    ('search_entities', 'GET', '/search?q={people}', None),
+    ('get_users', 'GET', '/users', None),
+    ('get_favorites', 'GET', '/users/favorites?user_id={users}', None),
+    ('add_favorite_planet', 'POST', '/favorite/planet/{planets}?user_id={users}', None),
+    ('remove_favorite_planet', 'DELETE', '/favorite/planet/{planets}?user_id={users}', None),
+    ('add_favorite_people', 'POST', '/favorite/people/{people}?user_id={users}', None),
+    ('remove_favorite_people', 'DELETE', '/favorite/people/{people}?user_id={users}', None),
+    ('replace_favorites', 'PUT', '/users/{users}/favorites', {'planets': list(range(1, 11)), 'people': list(range(1, 21))}),
+    ('update_favorites', 'PATCH', '/users/{users}/favorites', {'planets': {'add': [2, 4], 'remove': [1, 3]}}),
+    ('get_favorites_leaderboard', 'GET', '/leaderboard/favorites?limit=20', None),
+]
+
+# read scenarios also loaded over HTTP
+HTTP_SCENARIOS = [
+    '/people?limit=50&after={people}',
+    '/people/{people}',
+    '/planets/{planets}',
+    '/users/favorites?user_id={users}',
+    '/search?q={people}',
+]
+
+def is_heavy(path):
+    return 'stream=1' in path
+
+def label(method, path):
+    return f'{method} {path}'
+
+def path_maker(counts, rng):
+    def make(path):
+        return path.format(**{resource: rng.randint(1, count) for resource, count in counts.items()})
+    return make
+
+def summarize(latencies, elapsed, errors):
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'rps': round(len(latencies) / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+    }
+
+def peak_rss_mb(pid=None):
+    """
+    Peak resident memory (VmHWM) of `pid` plus its children, or of this
+    process when pid is None. Linux only for other processes.
+    """
+    if pid is None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+    total = 0
+    for child in [pid] + _children(pid):
+        try:
+            with open(f'/proc/{child}/status') as f:
+                total += next(int(line.split()[1]) for line in f if line.startswith('VmHWM'))
+        except (OSError, StopIteration):
+            pass
+    return round(total / 1024, 1) if total else None
+
+def _children(pid):
+    try:
+        with open(f'/proc/{pid}/task/{pid}/children') as f:
+            return [int(child) for child in f.read().split()]
+    except OSError:
+        return []
+
+def run_client(app, counts, iterations, rng):
+    from cache import response_cache, entity_cache
+    response_cache.enabled = entity_cache.enabled = False
+    make = path_maker(counts, rng)
+    client = app.test_client()
+    results = {}
+    for endpoint, method, path, body in SCENARIOS:
+        runs = max(1, iterations // 20) if is_heavy(path) else iterations
+        latencies, errors = [], 0
+        for _ in range(runs + 1):
+            url = make(path)
+            start = time.perf_counter()
+            headers = {'If-Match': '*'} if method in ('PATCH', 'PUT') else None
+            response = client.open(url, method=method, json=body, headers=headers)
+            response.get_data()
+            latencies.append(time.perf_counter() - start)
+            if response.status_code >= 400:
+                errors += 1
+        latencies = latencies[1:]  # the first one warms up
+        results[label(method, path)] = summarize(latencies, sum(latencies), errors)
+    return results
+
+def run_http(database_url, counts, servers, workers, requests, concurrency, rng):
+    env = dict(os.environ, DATABASE_URL=database_url, PYTHONWARNINGS='ignore')
+    make = path_maker(counts, rng)
+    results, rss = {}, {}
+    for mode in servers:
+        port = free_port()
+        process = start_server(mode, port, workers, env)
+        try:
+            for path in HTTP_SCENARIOS:
+                latencies, errors, elapsed = asyncio.run(run_load(port, lambda: make(path), requests, concurrency))
+                results[f'{mode} GET {path}'] = summarize(latencies, elapsed, errors)
+            rss[mode] = peak_rss_mb(process.pid)
+        finally:
+            process.terminate()
+            process.wait()
+    return results, rss
+
+def uncovered_endpoints(app):
+    covered = {endpoint for endpoint, *_ in SCENARIOS}
+    return sorted(rule.endpoint for rule in app.url_map.iter_rules()
+                  if rule.endpoint not in covered and rule.endpoint != 'static' and not rule.rule.startswith('/admin'))
+
+def print_table(title, results):
+    print(f'\n{title}')
+    print(f"{'scenario':<62}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'errors':>7}")
+    for name, row in results.items():
+        print(f"{name[:61]:<62}{row['rps']:>9,.0f}{row['p50_ms']:>9.1f}{row['p95_ms']:>9.1f}{row['p99_ms']:>9.1f}{row['errors']:>7}")
+
+def compare(report, baseline, tolerance, min_delta_ms):
+    """Prints the p95 change of every scenario; returns the regressed ones."""
+    if baseline['meta'].get('people') != report['meta']['people']:
+        print(f"\nwarning: baseline was run with --people {baseline['meta'].get('people')}")
+    regressions = []
+    print(f"\n{'p95 vs baseline':<62}{'before':>9}{'after':>9}{'change':>9}")
+    for section in ('client', 'http'):
+        for name, row in report[section].items():
+            before = baseline.get(section, {}).get(name)
+            if not before or not before['p95_ms']:
+                continue
+            change = row['p95_ms'] / before['p95_ms'] - 1
+            slower = change > tolerance and row['p95_ms'] - before['p95_ms'] > min_delta_ms
+            flag = ' REGRESSION' if slower else ''
+            print(f"{name[:61]:<62}{before['p95_ms']:>9.1f}{row['p95_ms']:>9.1f}{change:>+9.0%}{flag}")
+            if flag:
+                regressions.append(name)
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--people', type=int, default=1000, help='dataset scale, e.g. 1000 to 1000000')
+    parser.add_argument('--database-url', help='defaults to a temporary SQLite file')
+    parser.add_argument('--iterations', type=int, default=50, help='test client requests per scenario')
+    parser.add_argument('--servers', default='wsgi', help="comma separated: wsgi, asgi, or '' to skip HTTP")
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--requests', type=int, default=1000, help='HTTP requests per scenario')
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--baseline', help='JSON report to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.5, help='allowed p95 slowdown (0.5 = 50%%)')
+    parser.add_argument('--min-delta-ms', type=float, default=1.0, help='smaller p95 changes are noise')
+    parser.add_argument('--save-baseline', help='write this run as a baseline')
+    args = parser.parse_args()
+
+    database_url = args.database_url or f'sqlite:///{tempfile.mkdtemp()}/suite.db'
+    os.environ['DATABASE_URL'] = database_url
+    from app import app
+    counts = ensure_seeded(app, args.people, args.seed)
+    rng = random.Random(args.seed)
+
+    missing = uncovered_endpoints(app)
+    if missing:
+        print(f"warning: routes without a scenario: {', '.join(missing)}")
+
+    report = {
+        'meta': {
+            'people': args.people,
+            'iterations': args.iterations,
+            'database': database_url.split(':', 1)[0],
+            'python': platform.python_version(),
+            'machine': f'{platform.system()} {platform.machine()} {os.cpu_count()} cpus',
+            'date': datetime.now().isoformat(timespec='seconds'),
+        },
+        'client': run_client(app, counts, args.iterations, rng),
+    }
+    report['rss_mb'] = {'client': peak_rss_mb()}
+    servers = [mode for mode in args.servers.split(',') if mode]
+    report['http'], server_rss = run_http(database_url, counts, servers, args.workers,
+                                          args.requests, args.concurrency, rng)
+    report['rss_mb'].update(server_rss)
+
+    print_table(f"Test client, {args.iterations} requests per scenario, {args.people} people", report['client'])
+    if report['http']:
+        print_table(f'HTTP, {args.requests} requests per scenario, {args.concurrency} in flight', report['http'])
+    print(f"\npeak RSS (MB): {', '.join(f'{name} {value}' for name, value in report['rss_mb'].items())}")
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            json.dump(report, f, indent=2)
+            f.write('\n')
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.tolerance, args.min_delta_ms)
+        if regressions:
+            print(f'\n{len(regressions)} regression(s) over {args.tolerance:.0%}')
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
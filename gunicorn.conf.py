@@ -0,0 +1,38 @@
+# Loaded automatically by `gunicorn wsgi --chdir ./src/` (see Procfile).
+# Each worker holds at most DB_POOL_SIZE + DB_MAX_OVERFLOW connections, so the
+# total against the database is bounded by workers * (size + overflow).
+import os
+import shutil
+
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+
+
+def post_fork(server, worker):
+    # with preload_app the engines exist before forking; never share their sockets
+    from app import app, db
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
+
+
+def on_starting(server):
+    # samples of the previous run would otherwise be added to the new ones
+    directory = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+    if directory:
+        shutil.rmtree(directory, ignore_errors=True)
+        os.makedirs(directory)
+    # the SQLite cache file outlives the server; start with no entries and no counters
+    from cache import DEFAULT_CACHE_URL
+    url = os.environ.get('CACHE_URL', DEFAULT_CACHE_URL)
+    if url.startswith('sqlite:///'):
+        path = url[len('sqlite:///'):]
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+
+
+def child_exit(server, worker):
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
@@ -26,6 +26,8 @@ config.set_main_option(
         '%', '%%'))
 target_db = current_app.extensions['migrate'].db
 
+from search import SEARCH_TABLE  # noqa: E402
+
 # other values from the config, defined by the needs of env.py,
 # can be acquired:
 # my_important_option = config.get_main_option("my_important_option")
@@ -38,6 +40,19 @@ def get_metadata():
     return target_db.metadata
 
 
+def include_name(name, type_, parent_names):
+    """Leaves the full-text search index out of autogenerate.
+
+    search_index (the FTS5 virtual table and its search_index_* shadow tables
+    on SQLite, the tsvector table and its GIN index on Postgres) is created
+    with raw DDL by its migration and by `flask search-reindex`; it is not in
+    the models' metadata, so autogenerate would otherwise drop it.
+    """
+    if type_ == 'table':
+        return not name.startswith(SEARCH_TABLE)
+    return True
+
+
 def run_migrations_offline():
     """Run migrations in 'offline' mode.
 
@@ -52,7 +67,8 @@ def run_migrations_offline():
     """
     url = config.get_main_option("sqlalchemy.url")
     context.configure(
-        url=url, target_metadata=get_metadata(), literal_binds=True
+        url=url, target_metadata=get_metadata(), literal_binds=True,
+        include_name=include_name
     )
 
     with context.begin_transaction():
@@ -84,6 +100,7 @@ def run_migrations_online():
             connection=connection,
             target_metadata=get_metadata(),
             process_revision_directives=process_revision_directives,
+            include_name=include_name,
             **current_app.extensions['migrate'].configure_args
         )
 
@@ -0,0 +1,69 @@
+"""numeric shadow columns for SWAPI measurements
+
+Revision ID: a3f1c9d2e4b7
+Revises: 6218de64b146
+Create Date: 2026-10-18 09:12:40.118204
+
+"""
+import re
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a3f1c9d2e4b7'
+down_revision = '6218de64b146'
+branch_labels = None
+depends_on = None
+
+SHADOWS = {
+    'people': ['height', 'mass'],
+    'planet': ['diameter', 'rotation_period', 'orbital_period', 'population', 'surface_water'],
+    'starship': ['cost_in_credits', 'length', 'max_atmosphering_speed', 'hyperdrive_rating', 'cargo_capacity'],
+    'vehicle': ['cost_in_credits', 'length', 'max_atmosphering_speed', 'cargo_capacity'],
+    'species': ['average_height', 'average_lifespan'],
+}
+
+NUMBER = re.compile(r'^-?\d+(\.\d+)?$')
+
+# Frozen copy of models.parse_number, so this migration keeps working if it changes.
+def parse_number(value):
+    if value is None:
+        return None
+    text = str(value).strip().lower().replace(',', '')
+    if text.endswith('km'):
+        text = text[:-2].strip()
+    if not NUMBER.match(text):
+        return None
+    return float(text)
+
+
+def upgrade():
+    for table, fields in SHADOWS.items():
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            for field in fields:
+                batch_op.add_column(sa.Column(f'{field}_num', sa.Float(), nullable=True))
+                batch_op.create_index(batch_op.f(f'ix_{table}_{field}_num'), [f'{field}_num'], unique=False)
+
+    # backfill the shadow columns from the existing strings
+    connection = op.get_bind()
+    for table, fields in SHADOWS.items():
+        source = sa.table(table, sa.column('id'), *[sa.column(field) for field in fields])
+        target = sa.table(table, sa.column('id'), *[sa.column(f'{field}_num') for field in fields])
+        updates = [
+            {'row_id': row.id, **{f'{field}_num': parse_number(getattr(row, field)) for field in fields}}
+            for row in connection.execute(sa.select(source))
+        ]
+        if updates:
+            connection.execute(
+                target.update().where(target.c.id == sa.bindparam('row_id')),
+                updates
+            )
+
+
+def downgrade():
+    for table, fields in SHADOWS.items():
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            for field in fields:
+                batch_op.drop_index(batch_op.f(f'ix_{table}_{field}_num'))
+                batch_op.drop_column(f'{field}_num')
@@ -0,0 +1,35 @@
+"""indexes on name and title for filtering and sorting
+
+Revision ID: c84e2b7f5d19
+Revises: a3f1c9d2e4b7
+Create Date: 2026-10-18 10:03:27.551930
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c84e2b7f5d19'
+down_revision = 'a3f1c9d2e4b7'
+branch_labels = None
+depends_on = None
+
+INDEXES = [
+    ('people', 'name'),
+    ('planet', 'name'),
+    ('starship', 'name'),
+    ('vehicle', 'name'),
+    ('species', 'name'),
+    ('film', 'title'),
+]
+
+
+def upgrade():
+    for table, column in INDEXES:
+        op.create_index(op.f(f'ix_{table}_{column}'), table, [column], unique=False)
+
+
+def downgrade():
+    for table, column in INDEXES:
+        op.drop_index(op.f(f'ix_{table}_{column}'), table_name=table)
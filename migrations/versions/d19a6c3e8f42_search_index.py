@@ -0,0 +1,61 @@
+"""full-text search index
+
+Revision ID: d19a6c3e8f42
+Revises: c84e2b7f5d19
+Create Date: 2026-10-18 11:26:05.804377
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd19a6c3e8f42'
+down_revision = 'c84e2b7f5d19'
+branch_labels = None
+depends_on = None
+
+# entity type, table, indexed columns (frozen copy of search.SEARCHABLE)
+SEARCHABLE = [
+    ('people', 'people', ['name']),
+    ('planets', 'planet', ['name', 'climate', 'terrain']),
+    ('films', 'film', ['title', 'opening_crawl', 'director', 'producer']),
+    ('species', 'species', ['name', 'classification', 'designation', 'language']),
+    ('starships', 'starship', ['name', 'model', 'manufacturer', 'starship_class']),
+    ('vehicles', 'vehicle', ['name', 'model', 'manufacturer', 'vehicle_class']),
+]
+ROWID_STRIDE = 8
+
+
+def content(columns):
+    return " || ' ' || ".join(f"COALESCE({column}, '')" for column in columns)
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'sqlite':
+        op.execute(
+            "CREATE VIRTUAL TABLE search_index USING fts5("
+            "entity UNINDEXED, entity_id UNINDEXED, content, tokenize='unicode61 remove_diacritics 2')"
+        )
+        for code, (entity, table, columns) in enumerate(SEARCHABLE):
+            op.execute(
+                f"INSERT INTO search_index (rowid, entity, entity_id, content) "
+                f"SELECT id * {ROWID_STRIDE} + {code}, '{entity}', id, {content(columns)} FROM {table}"
+            )
+    elif dialect == 'postgresql':
+        op.execute(
+            'CREATE TABLE search_index ('
+            'entity VARCHAR(20) NOT NULL, entity_id INTEGER NOT NULL, document TSVECTOR NOT NULL, '
+            'PRIMARY KEY (entity, entity_id))'
+        )
+        op.execute('CREATE INDEX ix_search_index_document ON search_index USING GIN (document)')
+        for entity, table, columns in SEARCHABLE:
+            op.execute(
+                f"INSERT INTO search_index (entity, entity_id, document) "
+                f"SELECT '{entity}', id, to_tsvector('english', {content(columns)}) FROM {table}"
+            )
+
+
+def downgrade():
+    op.execute('DROP TABLE IF EXISTS search_index')
@@ -0,0 +1,43 @@
+"""reverse indexes on association tables and film episode
+
+Revision ID: e6b4f0a2c7d3
+Revises: d19a6c3e8f42
+Create Date: 2026-10-18 12:41:52.390417
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e6b4f0a2c7d3'
+down_revision = 'd19a6c3e8f42'
+branch_labels = None
+depends_on = None
+
+# table, leading column, second column
+REVERSE_INDEXES = [
+    ('user_favorites_planets', 'planet_id', 'user_id'),
+    ('user_favorites_people', 'people_id', 'user_id'),
+    ('people_films', 'film_id', 'people_id'),
+    ('species_people', 'people_id', 'species_id'),
+    ('people_starships', 'starship_id', 'people_id'),
+    ('people_vehicles', 'vehicle_id', 'people_id'),
+    ('planets_people', 'people_id', 'planet_id'),
+    ('species_films', 'film_id', 'species_id'),
+    ('starships_films', 'film_id', 'starship_id'),
+    ('vehicles_films', 'film_id', 'vehicle_id'),
+    ('planets_films', 'film_id', 'planet_id'),
+]
+
+
+def upgrade():
+    for table, leading, second in REVERSE_INDEXES:
+        op.create_index(f'ix_{table}_{leading}', table, [leading, second], unique=False)
+    op.create_index(op.f('ix_film_episode_id'), 'film', ['episode_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_film_episode_id'), table_name='film')
+    for table, leading, second in REVERSE_INDEXES:
+        op.drop_index(f'ix_{table}_{leading}', table_name=table)
@@ -0,0 +1,40 @@
+"""favorite counters on people and planet
+
+Revision ID: f3a8d51c6b20
+Revises: e6b4f0a2c7d3
+Create Date: 2026-10-18 16:05:12.518204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3a8d51c6b20'
+down_revision = 'e6b4f0a2c7d3'
+branch_labels = None
+depends_on = None
+
+# table, favorites table, column pointing at the table
+COUNTED = [
+    ('people', 'user_favorites_people', 'people_id'),
+    ('planet', 'user_favorites_planets', 'planet_id'),
+]
+
+
+def upgrade():
+    for table, favorites, column in COUNTED:
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.add_column(sa.Column('favorite_count', sa.Integer(), nullable=False, server_default='0'))
+        op.execute(
+            f'UPDATE {table} SET favorite_count = '
+            f'(SELECT count(*) FROM {favorites} WHERE {favorites}.{column} = {table}.id)'
+        )
+        op.create_index(f'ix_{table}_favorite_count', table, ['favorite_count', 'id'], unique=False)
+
+
+def downgrade():
+    for table, _, _ in COUNTED:
+        op.drop_index(f'ix_{table}_favorite_count', table_name=table)
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.drop_column('favorite_count')
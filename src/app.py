@@ -2,14 +2,31 @@
 This module takes care of starting the API Server, Loading the DB and Adding the endpoints
 """
 import os
-from flask import Flask, request, jsonify, url_for
+from flask import Flask, request, jsonify, url_for, abort
 from flask_migrate import Migrate
 from flask_swagger import swagger
 from flask_cors import CORS
-from datetime import datetime
-from utils import APIException, generate_sitemap
+from sqlalchemy import select, exists, delete, insert, update, or_, true, false
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import selectinload, load_only
+from utils import APIException, generate_sitemap, MAX_PAGE_LIMIT, get_keyset_args, keyset_paginate, page_response, wants_stream, ndjson_response, read_json_items, sort_clauses, parse_ids, in_request_order, version_etag, parse_version_etag
 from admin import setup_admin
-from models import db, User, People, Film, Starship, Vehicle, Species, Planet
+from expand import parse_expand, expand_options, serialize_expanded
+from fields import parse_fields
+from filters import apply_filters, parse_sort
+from cache import response_cache, entity_cache, init_cache, DEFAULT_CACHE_URL
+from swapi_import import import_swapi
+import search
+from explain import check_indexes
+from db_config import engine_options, instrument_pools, pool_stats
+from query_stats import init_query_stats, query_budget
+from metrics import init_metrics, metrics_response
+from routing import init_replicas, mark_user_sticky, reads_only, request_user_id
+from serializers import init_json, row_encoder_for, parse_datetime, deserialize, serializable_fields
+from models import db, User, People, Film, Starship, Vehicle, Species, Planet, next_edited
+from models import user_favorites_planets, user_favorites_people, insert_ignore, people_films, planets_people
+from graph import entity_graph
+from favorites import FAVORITE_COLLECTIONS, bump_favorite_counts, delete_favorites, leaderboard_statement, reconcile_favorites
 #from models import Person
 
 app = Flask(__name__)
@@ -21,11 +38,39 @@ if db_url is not None:
 else:
     app.config['SQLALCHEMY_DATABASE_URI'] = "sqlite:////tmp/test.db"
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config['SQLALCHEMY_DATABASE_URI'])
+replica_urls = [url.strip().replace("postgres://", "postgresql://") for url in os.getenv("DATABASE_REPLICA_URLS", "").split(",") if url.strip()]
+if replica_urls:
+    app.config['READ_YOUR_WRITES_SECONDS'] = int(os.getenv('READ_YOUR_WRITES_SECONDS', 5))
+    init_replicas(app, replica_urls)
+app.config['RESPONSE_CACHE_SIZE'] = int(os.getenv('RESPONSE_CACHE_SIZE', 512))
+app.config['RESPONSE_CACHE_TTL'] = int(os.getenv('RESPONSE_CACHE_TTL', 300))
+app.config['ENTITY_CACHE_TTL'] = int(os.getenv('ENTITY_CACHE_TTL', 300))
+app.config['BULK_MAX_ITEMS'] = int(os.getenv('BULK_MAX_ITEMS', 10000))
+app.config['BULK_CHUNK_SIZE'] = int(os.getenv('BULK_CHUNK_SIZE', 500))
+app.config['JSON_PROVIDER'] = os.getenv('JSON_PROVIDER', 'auto')
+# sqlite:////tmp/swapi-cache.db (default, shared by the workers and CLI commands of one machine),
+# redis://... to share it between machines, or memory:// for a single process
+app.config['CACHE_URL'] = os.getenv('CACHE_URL', DEFAULT_CACHE_URL)
+# maximum SQL statements per request, 0 = no limit (fails the request under app.testing)
+app.config['QUERY_BUDGET'] = int(os.getenv('QUERY_BUDGET', 0))
+app.config['QUERY_STATS_SLOWEST'] = int(os.getenv('QUERY_STATS_SLOWEST', 3))
+# seconds before the in-memory entity graph reloads a table even if no write was seen
+app.config['GRAPH_MAX_AGE'] = int(os.getenv('GRAPH_MAX_AGE', 60))
+
+init_json(app)
 MIGRATE = Migrate(app, db)
 db.init_app(app)
+instrument_pools(app, db)
+init_query_stats(app)
+init_metrics(app)
 CORS(app)
+init_cache(app)
 setup_admin(app)
+app.cli.add_command(import_swapi)
+app.cli.add_command(search.search_reindex)
+app.cli.add_command(check_indexes)
+app.cli.add_command(reconcile_favorites)
 
 # Handle/serialize errors like a JSON object
 @app.errorhandler(APIException)
@@ -37,6 +82,219 @@ def handle_invalid_usage(error):
 def sitemap():
     return generate_sitemap(app)
 
+def list_response(query, key_column, serialize, order=()):
+    """
+    Serializes a collection, paginated by cursor when the client sends
+    `?limit=` and/or `?after=<cursor>`, streamed as NDJSON when it sends
+    `?stream=1` or `Accept: application/x-ndjson`, or the whole table otherwise.
+    """
+    if wants_stream():
+        return ndjson_response(query.order_by(*sort_clauses(order), key_column), serialize)
+    limit, after = get_keyset_args()
+    if limit is None:
+        rows = query.order_by(*sort_clauses(order), key_column).all()
+        return jsonify([serialize(row) for row in rows])
+    rows, next_cursor = keyset_paginate(query, key_column, limit, after, order)
+    return page_response([serialize(row) for row in rows], next_cursor, limit)
+
+def entity_query(model, extra_columns=()):
+    """
+    Builds the query for a model honoring `?expand=` and `?fields=`, and the
+    matching serializer. A plain sparse fieldset selects bare columns and
+    skips building ORM objects altogether. `extra_columns` (e.g. sort keys)
+    are selected too but not serialized.
+    """
+    fields = parse_fields(model, request.args.get('fields'))
+    tree = parse_expand(model, request.args.get('expand'))
+    if fields and not tree:
+        columns = [getattr(model, name) for name in fields]
+        return model.query.with_entities(*columns, *extra_columns), row_encoder_for(model, tuple(fields))
+
+    query = model.query.options(*expand_options(model, tree))
+    if fields:
+        query = query.options(load_only(*[getattr(model, name) for name in fields], *extra_columns))
+    return query, lambda obj: serialize_expanded(obj, tree, fields)
+
+def entity_list_response(model):
+    """
+    List view shared by the models: filters and sorting are applied in SQL.
+    """
+    if 'ids' in request.args:
+        return ids_response(model)
+    order = parse_sort(model, request.args.get('sort'))
+    query, serialize = entity_query(model, [column for column, _ in order])
+    query = apply_filters(model, query, request.args)
+    return list_response(query, model.id, serialize, order)
+
+def ids_response(model):
+    """
+    `?ids=1,4,9`: those entities in request order, fetched with one IN query,
+    with a not-found marker for every id that does not exist (or does not
+    match the other filters).
+    """
+    ids = parse_ids(request.args['ids'])
+    query, serialize = entity_query(model)
+    rows = apply_filters(model, query, request.args).filter(model.id.in_(set(ids))).all()
+    return jsonify({'results': in_request_order(ids, rows, serialize), 'count': len(ids)})
+
+def load_by_ids(model, ids):
+    """
+    Loads entities with one IN query, reusing the ones already in the
+    session's identity map.
+    """
+    identity_map = db.session.identity_map
+    loaded = [identity_map.get(db.session.identity_key(model, pk)) for pk in set(ids)]
+    loaded = [obj for obj in loaded if obj is not None]
+    missing = set(ids) - {obj.id for obj in loaded}
+    if missing:
+        loaded += model.query.filter(model.id.in_(missing)).all()
+    return loaded
+
+def entity_response(model, pk):
+    """
+    Detail view shared by the models. Plain lookups are served from the
+    entity cache; `?fields=`/`?expand=` variants go to the database. The ETag
+    of the plain representation is the version of the entity (its `edited`),
+    what PATCH/PUT expect in If-Match; the variants embed related rows that
+    do not move `edited`, so they keep the body hash of the response cache.
+    """
+    if not request.args.get('fields') and not request.args.get('expand'):
+        body = entity_cache.get_json(model, pk, lambda pk: model.query.get_or_404(pk).to_dict())
+        response = app.response_class(body + '\n', mimetype='application/json')
+        response.set_etag(version_etag(app.json.loads(body)['edited']))
+        return response
+    query, serialize = entity_query(model)
+    return jsonify(serialize(query.filter(model.id == pk).first_or_404()))
+
+def if_match_condition(model):
+    """
+    WHERE clause for the versions listed in If-Match, and the newest of them.
+    Weak tags never match, as RFC 9110 asks for If-Match.
+    """
+    if request.if_match.star_tag:
+        return true(), None
+    versions = []
+    for tag in request.if_match.as_set():
+        try:
+            versions.append(parse_version_etag(tag))
+        except ValueError:
+            continue
+    if not versions:
+        return false(), None
+    clauses = [model.edited.is_(None) if version is None else model.edited == version for version in versions]
+    return or_(*clauses), max((version for version in versions if version is not None), default=None)
+
+def update_entity(model, pk):
+    """
+    PATCH (the fields sent) or PUT (every field; missing ones become null)
+    of one entity, with optimistic concurrency on `edited`: the client sends
+    the ETag it read in If-Match and the change is one
+    UPDATE ... WHERE id = ? AND edited = ? that also moves `edited` forward.
+    Nothing is read or locked first; only when no row matched does one SELECT
+    tell a missing entity (404) from a stale version (412).
+    """
+    if 'If-Match' not in request.headers:
+        raise APIException('Falta la cabecera If-Match con el ETag del recurso', status_code=428)
+    data = request.get_json(silent=True)
+    fields = serializable_fields(model)
+    if request.method == 'PUT' and isinstance(data, dict):
+        data = {**{name: None for name in fields if name not in ('id', 'created', 'edited')}, **data}
+    try:
+        values = deserialize(model, data, partial=request.method == 'PATCH')
+    except ValueError as e:
+        raise APIException(str(e), status_code=400)
+    values.pop('edited', None)  # the server moves it on every write
+    if not values:
+        raise APIException('No hay campos para actualizar', status_code=400)
+
+    condition, previous = if_match_condition(model)
+    edited = next_edited(previous)
+    columns = [getattr(model, name) for name in fields]
+    returning = db.session.get_bind().dialect.update_returning
+    stmt = update(model).where(model.id == pk, condition).values(**values, edited=edited)
+    if returning:
+        stmt = stmt.returning(*columns)
+    try:
+        result = db.session.execute(stmt, execution_options={'synchronize_session': False})
+        row = result.first() if returning else None
+        updated = row is not None if returning else result.rowcount == 1
+        if updated and set(values) & set(search.indexed_fields(model)):
+            search.reindex_ids(db.session.connection(), model, [pk])
+        db.session.commit()
+    except SQLAlchemyError:
+        db.session.rollback()
+        app.logger.exception('update of %s %s failed', model.__tablename__, pk)
+        raise APIException('No se pudo guardar el cambio', status_code=400)
+    except Exception:
+        db.session.rollback()
+        raise
+
+    if not updated:
+        current = db.session.execute(select(model.edited).where(model.id == pk)).first()
+        if current is None:
+            abort(404)
+        response = jsonify({'message': 'El recurso fue modificado por otra petición; vuelve a leerlo', 'etag': version_etag(current.edited)})
+        response.status_code = 412
+        response.set_etag(version_etag(current.edited))
+        return response
+
+    if row is None:
+        row = db.session.execute(select(*columns).where(model.id == pk)).first()
+    response = jsonify(row_encoder_for(model, fields)(row))
+    response.set_etag(version_etag(row.edited))  # the stored value; MySQL DATETIME drops the microseconds
+    return response
+
+def bulk_create(model):
+    """
+    Validates every item of a bulk POST first and rejects the whole request
+    if any of them is invalid. Valid batches are inserted with one executemany
+    INSERT per chunk of BULK_CHUNK_SIZE rows, each chunk in its own
+    transaction: a chunk the database rejects fails alone, with a generic
+    error (the details go to the log). Returns one result per item, in
+    request order.
+    """
+    items = read_json_items()
+    if not items:
+        raise APIException('No hay elementos para crear', status_code=400)
+    if len(items) > app.config['BULK_MAX_ITEMS']:
+        raise APIException(f"Máximo {app.config['BULK_MAX_ITEMS']} elementos por solicitud", status_code=413)
+
+    rows, errors = [], []
+    for index, item in enumerate(items):
+        try:
+            rows.append(deserialize(model, item))
+        except ValueError as e:
+            errors.append({'index': index, 'error': str(e)})
+    if errors:
+        return jsonify({'created': 0, 'errors': errors}), 400
+
+    returning = db.session.get_bind().dialect.insert_executemany_returning_sort_by_parameter_order
+    stmt = insert(model)
+    if returning:
+        stmt = stmt.returning(model.id, sort_by_parameter_order=True)
+
+    chunk_size = app.config['BULK_CHUNK_SIZE']
+    results = []
+    for start in range(0, len(rows), chunk_size):
+        chunk = rows[start:start + chunk_size]
+        try:
+            result = db.session.execute(stmt, chunk)
+            ids = result.scalars().all() if returning else [None] * len(chunk)
+            if returning:
+                search.reindex_ids(db.session.connection(), model, ids)
+            db.session.commit()
+        except SQLAlchemyError:
+            db.session.rollback()
+            app.logger.exception('bulk insert of %s failed', model.__tablename__)
+            results.extend({'index': index, 'error': 'No se pudo guardar este bloque de elementos'}
+                           for index in range(start, start + len(chunk)))
+            continue
+        results.extend({'index': start + offset, 'id': pk} for offset, pk in enumerate(ids))
+
+    created = sum(1 for result in results if 'error' not in result)
+    status = 201 if created == len(rows) else 207
+    return jsonify({'created': created, 'results': results}), status
+
 @app.route('/user', methods=['GET'])
 def handle_hello():
 
@@ -48,14 +306,18 @@ def handle_hello():
 
 # Endpoints for People
 @app.route('/people', methods=['GET'])
+@response_cache.cached(People)
 def get_people():
-    people = People.query.all()
-    return jsonify([person.to_dict() for person in people])
+    return entity_list_response(People)
 
 @app.route('/people/<int:people_id>', methods=['GET'])
+@response_cache.cached(People)
 def get_person(people_id):
-    person = People.query.get_or_404(people_id)
-    return jsonify(person.to_dict())
+    return entity_response(People, people_id)
+
+@app.route('/people/<int:people_id>', methods=['PATCH', 'PUT'])
+def update_person(people_id):
+    return update_entity(People, people_id)
 
 @app.route('/people', methods=['POST'])
 def add_person():
@@ -74,9 +336,9 @@ def add_person():
         edited = None
         try:
             if 'created' in data:
-                created = datetime.strptime(data['created'], "%a, %d %b %Y %H:%M:%S GMT")
+                created = parse_datetime(data['created'])
             if 'edited' in data:
-                edited = datetime.strptime(data['edited'], "%a, %d %b %Y %H:%M:%S GMT")
+                edited = parse_datetime(data['edited'])
         except ValueError:
             return jsonify({'error': 'Formato de fecha inválido'}), 400
 
@@ -102,16 +364,24 @@ def add_person():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/people/bulk', methods=['POST'])
+def add_people_bulk():
+    return bulk_create(People)
+
 # Endpoints for Planets
 @app.route('/planets', methods=['GET'])
+@response_cache.cached(Planet)
 def get_planets():
-    planets = Planet.query.all()
-    return jsonify([planet.to_dict() for planet in planets])
+    return entity_list_response(Planet)
 
 @app.route('/planets/<int:planet_id>', methods=['GET'])
+@response_cache.cached(Planet)
 def get_planet(planet_id):
-    planet = Planet.query.get_or_404(planet_id)
-    return jsonify(planet.to_dict())
+    return entity_response(Planet, planet_id)
+
+@app.route('/planets/<int:planet_id>', methods=['PATCH', 'PUT'])
+def update_planet(planet_id):
+    return update_entity(Planet, planet_id)
 
 @app.route('/planets', methods=['POST'])
 def add_planet():
@@ -130,9 +400,9 @@ def add_planet():
         edited = None
         try:
             if 'created' in data:
-                created = datetime.strptime(data['created'], "%a, %d %b %Y %H:%M:%S GMT")
+                created = parse_datetime(data['created'])
             if 'edited' in data:
-                edited = datetime.strptime(data['edited'], "%a, %d %b %Y %H:%M:%S GMT")
+                edited = parse_datetime(data['edited'])
         except ValueError:
             return jsonify({'error': 'Formato de fecha inválido'}), 400
 
@@ -159,16 +429,24 @@ def add_planet():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/planets/bulk', methods=['POST'])
+def add_planets_bulk():
+    return bulk_create(Planet)
+
 # Endpoints for Vehicles
 @app.route('/vehicles', methods=['GET'])
+@response_cache.cached(Vehicle)
 def get_vehicles():
-    vehicles = Vehicle.query.all()
-    return jsonify([vehicle.to_dict() for vehicle in vehicles])
+    return entity_list_response(Vehicle)
 
 @app.route('/vehicles/<int:vehicle_id>', methods=['GET'])
+@response_cache.cached(Vehicle)
 def get_vehicle(vehicle_id):
-    vehicle = Vehicle.query.get_or_404(vehicle_id)
-    return jsonify(vehicle.to_dict())
+    return entity_response(Vehicle, vehicle_id)
+
+@app.route('/vehicles/<int:vehicle_id>', methods=['PATCH', 'PUT'])
+def update_vehicle(vehicle_id):
+    return update_entity(Vehicle, vehicle_id)
 
 @app.route('/vehicles', methods=['POST'])
 def add_vehicle():
@@ -179,9 +457,9 @@ def add_vehicle():
         edited = None
         try:
             if 'created' in data:
-                created = datetime.strptime(data['created'], "%a, %d %b %Y %H:%M:%S GMT")
+                created = parse_datetime(data['created'])
             if 'edited' in data:
-                edited = datetime.strptime(data['edited'], "%a, %d %b %Y %H:%M:%S GMT")
+                edited = parse_datetime(data['edited'])
         except ValueError:
             return jsonify({'error': 'Formato de fecha inválido'}), 400
         
@@ -205,38 +483,183 @@ def add_vehicle():
         db.session.add(new_vehicle)
         db.session.commit()
 
-        return jsonify({
-            'id': new_vehicle.id,
-            'name': new_vehicle.name,
-            'model': new_vehicle.model,
-            'vehicle_class': new_vehicle.vehicle_class,
-            'manufacturer': new_vehicle.manufacturer,
-            'length': new_vehicle.length,
-            'cost_in_credits': new_vehicle.cost_in_credits,
-            'crew': new_vehicle.crew,
-            'passengers': new_vehicle.passengers,
-            'max_atmosphering_speed': new_vehicle.max_atmosphering_speed,
-            'cargo_capacity': new_vehicle.cargo_capacity,
-            'consumables': new_vehicle.consumables,
-            'created': new_vehicle.created.isoformat() if new_vehicle.created else None,
-            'edited': new_vehicle.edited.isoformat() if new_vehicle.edited else None,
-            'image': new_vehicle.image,
-        }), 201
+        return jsonify(new_vehicle.to_dict()), 201
 
     except Exception as e:
         return jsonify({'error': str(e)}), 400
 
 
+@app.route('/vehicles/bulk', methods=['POST'])
+def add_vehicles_bulk():
+    return bulk_create(Vehicle)
+
+# Endpoints for Films, Starships and Species
+@app.route('/films', methods=['GET'])
+@response_cache.cached(Film)
+def get_films():
+    return entity_list_response(Film)
+
+@app.route('/films/<int:film_id>', methods=['GET'])
+@response_cache.cached(Film)
+def get_film(film_id):
+    return entity_response(Film, film_id)
+
+@app.route('/films/<int:film_id>', methods=['PATCH', 'PUT'])
+def update_film(film_id):
+    return update_entity(Film, film_id)
+
+@app.route('/starships', methods=['GET'])
+@response_cache.cached(Starship)
+def get_starships():
+    return entity_list_response(Starship)
+
+@app.route('/starships/<int:starship_id>', methods=['GET'])
+@response_cache.cached(Starship)
+def get_starship(starship_id):
+    return entity_response(Starship, starship_id)
+
+@app.route('/starships/<int:starship_id>', methods=['PATCH', 'PUT'])
+def update_starship(starship_id):
+    return update_entity(Starship, starship_id)
+
+@app.route('/species', methods=['GET'])
+@response_cache.cached(Species)
+def get_species_list():
+    return entity_list_response(Species)
+
+@app.route('/species/<int:species_id>', methods=['GET'])
+@response_cache.cached(Species)
+def get_species(species_id):
+    return entity_response(Species, species_id)
+
+@app.route('/species/<int:species_id>', methods=['PATCH', 'PUT'])
+def update_species(species_id):
+    return update_entity(Species, species_id)
+
+# Graph traversals, answered from the in-memory adjacency index (graph.py)
+@app.route('/planets/<int:planet_id>/films-via-residents', methods=['GET'])
+def get_planet_films_via_residents(planet_id):
+    film_ids = entity_graph.traverse(Planet, planet_id, [
+        (planets_people, 'planet_id', 'people_id'),
+        (people_films, 'people_id', 'film_id'),
+    ])
+    films = entity_graph.describe(Film, film_ids)
+    return jsonify({'planet': planet_id, 'films': films, 'count': len(films)})
+
+@app.route('/films/<int:film_id>/homeworlds', methods=['GET'])
+def get_film_homeworlds(film_id):
+    planet_ids = entity_graph.traverse(Film, film_id, [
+        (people_films, 'film_id', 'people_id'),
+        (planets_people, 'people_id', 'planet_id'),
+    ])
+    planets = entity_graph.describe(Planet, planet_ids)
+    return jsonify({'film': film_id, 'planets': planets, 'count': len(planets)})
+
+# Many entities of several types in one round trip
+BATCH_RESOURCES = {
+    'people': People,
+    'planets': Planet,
+    'vehicles': Vehicle,
+    'films': Film,
+    'starships': Starship,
+    'species': Species,
+}
+
+@app.route('/batch', methods=['POST'])
+@reads_only
+def batch_get():
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or not data:
+        raise APIException('Se esperaba un objeto como {"people": [1, 4], "planets": [2]}', status_code=400)
+    requested = []
+    for resource, ids in data.items():
+        model = BATCH_RESOURCES.get(resource)
+        if model is None:
+            raise APIException(f'Tipo desconocido: {resource}', status_code=400)
+        if not isinstance(ids, list) or not all(isinstance(pk, int) and not isinstance(pk, bool) for pk in ids):
+            raise APIException(f'{resource} debe ser una lista de ids enteros', status_code=400)
+        requested.append((resource, model, ids))
+    if sum(len(ids) for _, _, ids in requested) > MAX_PAGE_LIMIT:
+        raise APIException(f'Máximo {MAX_PAGE_LIMIT} ids por solicitud', status_code=400)
+
+    return jsonify({
+        resource: in_request_order(ids, load_by_ids(model, ids), lambda obj: obj.to_dict())
+        for resource, model, ids in requested
+    })
+
+# Database pool usage, to tune the DB_POOL_* settings
+@app.route('/status/db-pool', methods=['GET'])
+def get_pool_status():
+    return jsonify({key: stats.snapshot() for key, stats in pool_stats.items()})
+
+# Prometheus metrics (see metrics.py)
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    return metrics_response()
+
+# Full-text search
+MAX_SEARCH_OFFSET = 1000
+
+@app.route('/search', methods=['GET'])
+@response_cache.cached(*[model for model, fields in search.SEARCHABLE.values()])
+def search_entities():
+    entities = [entity.strip() for entity in request.args.get('type', ','.join(search.SEARCHABLE)).split(',')]
+    unknown = [entity for entity in entities if entity not in search.SEARCHABLE]
+    if unknown:
+        raise APIException(f"Tipo desconocido: {', '.join(unknown)}", status_code=400)
+    limit = request.args.get('limit', type=int, default=20)
+    page = request.args.get('page', type=int, default=1)
+    if limit is None or not 1 <= limit <= MAX_PAGE_LIMIT or page is None or page < 1:
+        raise APIException(f'limit debe estar entre 1 y {MAX_PAGE_LIMIT} y page ser positivo', status_code=400)
+    offset = (page - 1) * limit
+    if offset > MAX_SEARCH_OFFSET:
+        raise APIException('Refina la búsqueda: no se sirven resultados tan profundos', status_code=400)
+
+    hits = search.search(db.session.connection(), request.args.get('q', ''), entities, limit + 1, offset)
+    has_more = len(hits) > limit
+    hits = hits[:limit]
+
+    # one IN query per entity type found
+    objects = {}
+    for entity in {hit.entity for hit in hits}:
+        model = search.SEARCHABLE[entity][0]
+        ids = [hit.entity_id for hit in hits if hit.entity == entity]
+        for obj in model.query.filter(model.id.in_(ids)):
+            objects[(entity, obj.id)] = obj
+    results = [
+        {'type': hit.entity, 'id': hit.entity_id, 'score': hit.score, 'item': objects[(hit.entity, hit.entity_id)].to_dict()}
+        for hit in hits if (hit.entity, hit.entity_id) in objects
+    ]
+    return jsonify({
+        'results': results,
+        'count': len(results),
+        'page': page,
+        'next_page': page + 1 if has_more else None,
+    })
+
 # Endpoints for Users
 @app.route('/users', methods=['GET'])
 def get_users():
-    users = User.query.all()
-    return jsonify([user.email for user in users])
+    return list_response(User.query, User.id, lambda user: user.email)
+
+def ensure_exist_or_404(*pairs):
+    """
+    Checks that every (Model, id) pair exists with a single SELECT EXISTS,
+    without loading the rows.
+    """
+    checks = [exists().where(model.id == pk) for model, pk in pairs]
+    if not all(db.session.execute(select(*checks)).one()):
+        abort(404)
 
 @app.route('/users/favorites', methods=['GET'])
+@response_cache.cached(User, Planet, People, user_favorites_planets, user_favorites_people)
+@query_budget(3)
 def get_favorites():
-    current_user_id = request.args.get('user_id', type=int, default=1)  # Placeholder
-    user = User.query.get_or_404(current_user_id)
+    current_user_id = request_user_id()
+    user = User.query.options(
+        selectinload(User.favorites_planets),
+        selectinload(User.favorites_people)
+    ).get_or_404(current_user_id)
     favorite_planets = [planet.to_dict() for planet in user.favorites_planets]
     favorite_people = [person.to_dict() for person in user.favorites_people]
     return jsonify({
@@ -245,45 +668,174 @@ def get_favorites():
     })
 
 @app.route('/favorite/planet/<int:planet_id>', methods=['POST'])
+@query_budget(3)
 def add_favorite_planet(planet_id):
-    current_user_id = request.args.get('user_id', type=int, default=1)  # Placeholder
-    user = User.query.get_or_404(current_user_id)
-    planet = Planet.query.get_or_404(planet_id)
-    if planet not in user.favorites_planets:
-        user.favorites_planets.append(planet)
-        db.session.commit()
+    current_user_id = request_user_id()
+    ensure_exist_or_404((User, current_user_id), (Planet, planet_id))
+    if insert_ignore(user_favorites_planets, [{'user_id': current_user_id, 'planet_id': planet_id}]):
+        bump_favorite_counts(Planet, [planet_id], 1)
+    db.session.commit()
+    mark_user_sticky(current_user_id)
     return jsonify({'message': 'Favorite planet added!'})
 
 @app.route('/favorite/people/<int:people_id>', methods=['POST'])
+@query_budget(3)
 def add_favorite_people(people_id):
-    current_user_id = request.args.get('user_id', type=int, default=1)  # Placeholder
-    user = User.query.get_or_404(current_user_id)
-    person = People.query.get_or_404(people_id)
-    if person not in user.favorites_people:
-        user.favorites_people.append(person)
-        db.session.commit()
+    current_user_id = request_user_id()
+    ensure_exist_or_404((User, current_user_id), (People, people_id))
+    if insert_ignore(user_favorites_people, [{'user_id': current_user_id, 'people_id': people_id}]):
+        bump_favorite_counts(People, [people_id], 1)
+    db.session.commit()
+    mark_user_sticky(current_user_id)
     return jsonify({'message': 'Favorite person added!'})
 
 @app.route('/favorite/planet/<int:planet_id>', methods=['DELETE'])
+@query_budget(3)
 def remove_favorite_planet(planet_id):
-    current_user_id = request.args.get('user_id', type=int, default=1)  # Placeholder
-    user = User.query.get_or_404(current_user_id)
-    planet = Planet.query.get_or_404(planet_id)
-    if planet in user.favorites_planets:
-        user.favorites_planets.remove(planet)
-        db.session.commit()
+    current_user_id = request_user_id()
+    ensure_exist_or_404((User, current_user_id), (Planet, planet_id))
+    removed = db.session.execute(delete(user_favorites_planets).where(
+        user_favorites_planets.c.user_id == current_user_id,
+        user_favorites_planets.c.planet_id == planet_id
+    )).rowcount
+    bump_favorite_counts(Planet, [planet_id], -removed)
+    db.session.commit()
+    mark_user_sticky(current_user_id)
     return jsonify({'message': 'Favorite planet removed!'})
 
 @app.route('/favorite/people/<int:people_id>', methods=['DELETE'])
+@query_budget(3)
 def remove_favorite_people(people_id):
-    current_user_id = request.args.get('user_id', type=int, default=1)  # Placeholder
-    user = User.query.get_or_404(current_user_id)
-    person = People.query.get_or_404(people_id)
-    if person in user.favorites_people:
-        user.favorites_people.remove(person)
-        db.session.commit()
+    current_user_id = request_user_id()
+    ensure_exist_or_404((User, current_user_id), (People, people_id))
+    removed = db.session.execute(delete(user_favorites_people).where(
+        user_favorites_people.c.user_id == current_user_id,
+        user_favorites_people.c.people_id == people_id
+    )).rowcount
+    bump_favorite_counts(People, [people_id], -removed)
+    db.session.commit()
+    mark_user_sticky(current_user_id)
     return jsonify({'message': 'Favorite person removed!'})
 
+# Bulk favorites: whole lists of ids applied as set-based statements
+def read_id_list(value, name):
+    if not isinstance(value, list) or not all(isinstance(pk, int) and not isinstance(pk, bool) for pk in value):
+        raise APIException(f'{name} debe ser una lista de ids enteros', status_code=400)
+    if len(value) > MAX_PAGE_LIMIT:
+        raise APIException(f'{name} admite como máximo {MAX_PAGE_LIMIT} ids', status_code=400)
+    return set(value)
+
+def read_favorites_changes(replace):
+    """
+    Reads the body of PUT (`{"planets": [ids], "people": [ids]}`, the new
+    lists, a missing key meaning an empty list) or of PATCH
+    (`{"planets": {"add": [ids], "remove": [ids]}, ...}`).
+    Returns {collection: (ids to keep, ids to add, ids to remove)}; for PUT
+    `ids to keep` is the whole new set.
+    """
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        raise APIException('Los datos deben ser un objeto JSON.', status_code=400)
+    unknown = set(data) - set(FAVORITE_COLLECTIONS)
+    if unknown:
+        raise APIException(f"Colección desconocida: {', '.join(sorted(unknown))}", status_code=400)
+
+    changes = {}
+    for name in FAVORITE_COLLECTIONS:
+        if replace:
+            changes[name] = (read_id_list(data.get(name, []), name), None, None)
+        elif name in data:
+            change = data[name]
+            if not isinstance(change, dict) or set(change) - {'add', 'remove'}:
+                raise APIException(f'{name} debe ser un objeto con "add" y/o "remove"', status_code=400)
+            add = read_id_list(change.get('add', []), f'{name}.add')
+            remove = read_id_list(change.get('remove', []), f'{name}.remove')
+            if add & remove:
+                raise APIException(f'{name}: un id no puede estar en add y remove a la vez', status_code=400)
+            changes[name] = (None, add, remove)
+    return changes
+
+def ensure_ids_exist(model, ids):
+    if not ids:
+        return
+    found = set(db.session.execute(select(model.id).where(model.id.in_(ids))).scalars())
+    missing = sorted(ids - found)
+    if missing:
+        raise APIException(f'{model.__name__} inexistentes', status_code=404, payload={'missing': missing})
+
+def apply_favorites(user_id, replace):
+    """
+    Applies the diff between the stored favorites and the request with one
+    INSERT ... ON CONFLICT DO NOTHING and one DELETE ... WHERE IN per
+    collection, plus the favorite_count updates of the rows they returned,
+    all in one transaction.
+    """
+    changes = read_favorites_changes(replace)
+    ensure_exist_or_404((User, user_id))
+
+    result, added, removed = {}, {}, {}
+    try:
+        for name, (wanted, add, remove) in changes.items():
+            model, table, column = FAVORITE_COLLECTIONS[name]
+            target = table.c[column]
+            current = set(db.session.execute(select(target).where(table.c.user_id == user_id)).scalars())
+            if replace:
+                add, remove = wanted - current, current - wanted
+            else:
+                add, remove = add - current, remove & current
+            ensure_ids_exist(model, add)
+
+            # counters follow the rows each statement really changed, not the
+            # diff: an overlapping request may have applied part of it already
+            inserted = deleted = []
+            if add:
+                inserted = insert_ignore(table, [{'user_id': user_id, column: pk} for pk in sorted(add)], returning=column)
+                bump_favorite_counts(model, inserted, 1)
+            if remove:
+                deleted = delete_favorites(table, column, user_id, sorted(remove))
+                bump_favorite_counts(model, deleted, -1)
+            result[name] = sorted((current | add) - remove)
+            added[name] = sorted(inserted)
+            removed[name] = sorted(deleted)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    mark_user_sticky(user_id)
+    return jsonify({**result, 'added': added, 'removed': removed})
+
+@app.route('/users/<int:user_id>/favorites', methods=['PUT'])
+@query_budget(13)
+def replace_favorites(user_id):
+    return apply_favorites(user_id, replace=True)
+
+@app.route('/users/<int:user_id>/favorites', methods=['PATCH'])
+@query_budget(13)
+def update_favorites(user_id):
+    return apply_favorites(user_id, replace=False)
+
+# Most favorited planets and people, from the favorite_count index
+MAX_LEADERBOARD = 100
+
+@app.route('/leaderboard/favorites', methods=['GET'])
+@response_cache.cached(user_favorites_planets, user_favorites_people, Planet, People)
+def get_favorites_leaderboard():
+    limit = request.args.get('limit', type=int, default=10)
+    if limit is None or not 1 <= limit <= MAX_LEADERBOARD:
+        raise APIException(f'limit debe estar entre 1 y {MAX_LEADERBOARD}', status_code=400)
+    names = [name.strip() for name in request.args.get('type', ','.join(FAVORITE_COLLECTIONS)).split(',')]
+    unknown = [name for name in names if name not in FAVORITE_COLLECTIONS]
+    if unknown:
+        raise APIException(f"Tipo desconocido: {', '.join(unknown)}", status_code=400)
+
+    leaderboard = {}
+    for name in names:
+        model = FAVORITE_COLLECTIONS[name][0]
+        rows = db.session.execute(leaderboard_statement(model, limit))
+        leaderboard[name] = [{'id': pk, 'name': label, 'favorite_count': count} for pk, label, count in rows]
+    return jsonify(leaderboard)
+
 # this only runs if `$ python src/app.py` is executed
 if __name__ == '__main__':
     PORT = int(os.environ.get('PORT', 3000))
@@ -0,0 +1,227 @@
+"""
+ASGI entry point. The read-only entity routes (lists and details of people,
+planets, vehicles, films, starships and species) run as coroutines against an AsyncSession, so a single
+process can keep hundreds of requests waiting on the database at once. Every
+other route is handed to the regular Flask app through asgiref's WSGI adapter.
+
+    uvicorn asgi:application --app-dir src --port 3000
+
+The database URL is the same as the WSGI app's, switched to its async driver
+(sqlite -> aiosqlite, postgresql -> asyncpg). The async routes always read from
+the primary and skip the response/entity caches.
+"""
+import io
+from asgiref.wsgi import WsgiToAsgi
+from flask import request, jsonify, abort
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.orm import load_only
+from app import app
+from db_config import engine_options
+from expand import parse_expand, expand_options, serialize_expanded
+from fields import parse_fields
+from filters import apply_filters, parse_sort
+from models import People, Planet, Vehicle, Film, Starship, Species
+from serializers import row_encoder_for
+from utils import (STREAM_BATCH_SIZE, NDJSON_MIMETYPE, get_keyset_args, page_response, wants_stream,
+                   sort_clauses, after_cursor, decode_cursor, encode_cursor, parse_ids, in_request_order,
+                   version_etag)
+
+ASYNC_DRIVERS = {
+    'sqlite': 'sqlite+aiosqlite',
+    'postgresql': 'postgresql+asyncpg',
+}
+
+def async_url(url):
+    scheme, rest = url.split('://', 1)
+    driver = ASYNC_DRIVERS.get(scheme.split('+')[0])
+    if driver is None:
+        raise ValueError(f'No async driver for {scheme}')
+    return f'{driver}://{rest}'
+
+def async_engine_options(url):
+    options = engine_options(url)
+    connect_args = options.pop('connect_args', None)
+    if connect_args and url.startswith('postgresql'):
+        # asyncpg takes server settings instead of libpq's -c options
+        timeout = connect_args['options'].split('=', 1)[1]
+        options['connect_args'] = {'server_settings': {'statement_timeout': timeout}}
+    return options
+
+database_url = app.config['SQLALCHEMY_DATABASE_URI']
+engine = create_async_engine(async_url(database_url), **async_engine_options(database_url))
+Session = async_sessionmaker(engine, expire_on_commit=False)
+
+def entity_statement(model, extra_columns=()):
+    """
+    Async counterpart of app.entity_query: returns a select() honoring
+    `?fields=`/`?expand=`, its serializer and whether rows are ORM objects.
+    """
+    fields = parse_fields(model, request.args.get('fields'))
+    tree = parse_expand(model, request.args.get('expand'))
+    if fields and not tree:
+        columns = [getattr(model, name) for name in fields]
+        return select(*columns, *extra_columns), row_encoder_for(model, tuple(fields)), False
+
+    stmt = select(model).options(*expand_options(model, tree))
+    if fields:
+        stmt = stmt.options(load_only(*[getattr(model, name) for name in fields], *extra_columns))
+    return stmt, lambda obj: serialize_expanded(obj, tree, fields), True
+
+async def fetch(session, stmt, orm):
+    result = await session.execute(stmt)
+    return result.scalars().all() if orm else result.all()
+
+async def entity_list(session, send, model):
+    if 'ids' in request.args:
+        ids = parse_ids(request.args['ids'])
+        stmt, serialize, orm = entity_statement(model)
+        rows = await fetch(session, apply_filters(model, stmt, request.args).where(model.id.in_(set(ids))), orm)
+        return jsonify({'results': in_request_order(ids, rows, serialize), 'count': len(ids)})
+
+    order = parse_sort(model, request.args.get('sort'))
+    stmt, serialize, orm = entity_statement(model, [column for column, _ in order])
+    stmt = apply_filters(model, stmt, request.args).order_by(*sort_clauses(order), model.id)
+
+    if wants_stream():
+        await stream_ndjson(session, send, stmt, serialize, orm)
+        return None
+    limit, after = get_keyset_args()
+    if limit is None:
+        rows = await fetch(session, stmt, orm)
+        return jsonify([serialize(row) for row in rows])
+
+    if after is not None:
+        stmt = stmt.where(after_cursor(model.id, order, decode_cursor(after, order)))
+    rows = await fetch(session, stmt.limit(limit + 1), orm)
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1], model.id, order)
+    return page_response([serialize(row) for row in rows], next_cursor, limit)
+
+async def entity_detail(session, send, model, pk):
+    stmt, serialize, orm = entity_statement(model)
+    rows = await fetch(session, stmt.where(model.id == pk), orm)
+    if not rows:
+        abort(404)
+    data = serialize(rows[0])
+    response = jsonify(data)
+    if not request.args.get('fields') and not request.args.get('expand'):
+        response.set_etag(version_etag(data['edited']))  # same version ETag as entity_response
+    return response
+
+async def stream_ndjson(session, send, stmt, serialize, orm):
+    dumps = app.json.dumps
+    response = app.process_response(app.response_class(mimetype=NDJSON_MIMETYPE))
+    await send_start(send, response)
+    result = await session.stream(stmt.execution_options(yield_per=STREAM_BATCH_SIZE))
+    rows = result.scalars() if orm else result
+    async for row in rows:
+        await send({'type': 'http.response.body', 'body': (dumps(serialize(row)) + '\n').encode(), 'more_body': True})
+    await send({'type': 'http.response.body', 'body': b''})
+
+# endpoint name in app.py -> (handler, model)
+ASYNC_VIEWS = {
+    'get_people': (entity_list, People),
+    'get_person': (entity_detail, People),
+    'get_planets': (entity_list, Planet),
+    'get_planet': (entity_detail, Planet),
+    'get_vehicles': (entity_list, Vehicle),
+    'get_vehicle': (entity_detail, Vehicle),
+    'get_films': (entity_list, Film),
+    'get_film': (entity_detail, Film),
+    'get_starships': (entity_list, Starship),
+    'get_starship': (entity_detail, Starship),
+    'get_species_list': (entity_list, Species),
+    'get_species': (entity_detail, Species),
+}
+
+def build_environ(scope):
+    server = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', ''),
+        'PATH_INFO': scope['path'],
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': (scope.get('client') or ('', 0))[0],
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(),
+        'wsgi.errors': io.StringIO(),
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+        'wsgi.version': (1, 0),
+    }
+    for name, value in scope['headers']:
+        key = name.decode('latin-1').upper().replace('-', '_')
+        if key not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            key = 'HTTP_' + key
+        value = value.decode('latin-1')
+        environ[key] = f'{environ[key]},{value}' if key in environ else value
+    return environ
+
+async def send_start(send, response):
+    headers = [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in response.headers.items()]
+    await send({'type': 'http.response.start', 'status': response.status_code, 'headers': headers})
+
+async def send_response(send, response, method):
+    await send_start(send, response)
+    await send({'type': 'http.response.body', 'body': b'' if method == 'HEAD' else response.get_data()})
+
+class AsyncApp:
+    def __init__(self, flask_app):
+        self.flask_app = flask_app
+        self.wsgi = WsgiToAsgi(flask_app)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+        if scope['type'] != 'http' or scope['method'] not in ('GET', 'HEAD'):
+            return await self.wsgi(scope, receive, send)
+
+        ctx = self.flask_app.request_context(build_environ(scope))
+        ctx.push()
+        try:
+            view = ASYNC_VIEWS.get(request.endpoint)
+            if view is None:
+                ctx.pop()
+                ctx = None
+                return await self.wsgi(scope, receive, send)
+            await self.dispatch(view, send, scope['method'])
+        finally:
+            if ctx is not None:
+                ctx.pop()
+
+    async def dispatch(self, view, send, method):
+        handler, model = view
+        try:
+            response = self.flask_app.preprocess_request()
+            if response is None:
+                async with Session() as session:
+                    response = await handler(session, send, model, *request.view_args.values())
+            else:
+                response = self.flask_app.make_response(response)
+        except Exception as e:
+            try:
+                rv = self.flask_app.handle_user_exception(e)
+            except Exception as unhandled:
+                rv = self.flask_app.handle_exception(unhandled)
+            response = self.flask_app.make_response(rv)
+        if response is not None:
+            await send_response(send, self.flask_app.process_response(response), method)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await engine.dispose()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+application = AsyncApp(app)
@@ -0,0 +1,356 @@
+"""
+Caching for the read-only GET endpoints.
+
+Two layers share one pluggable backend (see `make_backend`):
+
+* `response_cache` keeps whole GET responses in a bounded, per-process LRU with
+  a TTL and answers If-None-Match / If-Modified-Since with 304.
+* `entity_cache` keeps the JSON of single entities (get_person, get_planet,
+  get_vehicle) in the backend itself, so with a shared backend every gunicorn
+  worker reuses what any other worker loaded.
+
+Every key embeds the current version of the tables it depends on. Versions are
+counters stored in the backend and bumped on commit for every table the
+session wrote to (API handlers, bulk statements or Flask-Admin), so with a
+shared backend a write in one worker invalidates the caches of all of them;
+stale entries are never read again and just expire.
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from functools import wraps
+from flask import request, Response, current_app
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+from routing import cache_ttl, read_source
+
+class LRUCache:
+    def __init__(self, maxsize=512, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires, value = item
+            if expires < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._data[key] = (time.monotonic() + (ttl or self.ttl), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+class MemoryBackend:
+    """
+    Per-process backend. Good for a single worker and for development.
+    """
+    def __init__(self, maxsize=4096):
+        self.store = LRUCache(maxsize)
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        return self.store.get(key)
+
+    def set(self, key, value, ttl):
+        self.store.set(key, value, ttl)
+
+    def incr(self, key):
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + 1
+            return self._counters[key]
+
+    def counters(self, keys):
+        return [self._counters.get(key, 0) for key in keys]
+
+class SQLiteBackend:
+    """
+    Backend stored in a local SQLite file (WAL mode), shared by every process
+    on the same machine. Connections are opened lazily per thread and per pid
+    so it is safe to use with forking servers.
+    """
+    PURGE_EVERY = 1000
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._writes = 0
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value BLOB, expires REAL)')
+            conn.execute('CREATE TABLE IF NOT EXISTS counters (key TEXT PRIMARY KEY, value INTEGER NOT NULL)')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get(self, key):
+        row = self._conn().execute(
+            'SELECT value FROM cache WHERE key = ? AND expires > ?', (key, time.time())
+        ).fetchone()
+        return row[0] if row else None
+
+    def set(self, key, value, ttl):
+        conn = self._conn()
+        conn.execute('INSERT OR REPLACE INTO cache VALUES (?, ?, ?)', (key, value, time.time() + ttl))
+        self._writes += 1
+        if self._writes % self.PURGE_EVERY == 0:
+            conn.execute('DELETE FROM cache WHERE expires <= ?', (time.time(),))
+
+    def incr(self, key):
+        return self._conn().execute(
+            'INSERT INTO counters VALUES (?, 1) '
+            'ON CONFLICT(key) DO UPDATE SET value = value + 1 RETURNING value', (key,)
+        ).fetchone()[0]
+
+    def counters(self, keys):
+        if not keys:
+            return []
+        placeholders = ','.join('?' * len(keys))
+        rows = dict(self._conn().execute(
+            f'SELECT key, value FROM counters WHERE key IN ({placeholders})', list(keys)
+        ).fetchall())
+        return [rows.get(key, 0) for key in keys]
+
+class RedisBackend:
+    """
+    Backend for any client exposing the redis-py `get`, `set(ex=)`, `incr`
+    and `mget` methods (Redis, Valkey, KeyDB, fakeredis...).
+    """
+    def __init__(self, client):
+        self.client = client
+
+    @classmethod
+    def from_url(cls, url):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError('CACHE_URL apunta a Redis pero el paquete redis no está instalado')
+        return cls(redis.Redis.from_url(url))
+
+    def get(self, key):
+        return self.client.get(key)
+
+    def set(self, key, value, ttl):
+        self.client.set(key, value, ex=int(ttl))
+
+    def incr(self, key):
+        return self.client.incr(key)
+
+    def counters(self, keys):
+        if not keys:
+            return []
+        return [int(value or 0) for value in self.client.mget(keys)]
+
+# a per-process backend would let each gunicorn worker keep serving what the
+# others already changed, so the default is shared by the whole machine
+DEFAULT_CACHE_URL = 'sqlite:////tmp/swapi-cache.db'
+
+def make_backend(url):
+    """
+    sqlite:////path/to/cache.db (DEFAULT_CACHE_URL), redis://host:port/db or
+    memory:// (one process only)
+    """
+    if not url or url.startswith('memory://'):
+        return MemoryBackend()
+    if url.startswith('sqlite:///'):
+        return SQLiteBackend(url[len('sqlite:///'):])
+    if url.startswith(('redis://', 'rediss://', 'unix://')):
+        return RedisBackend.from_url(url)
+    raise ValueError(f'CACHE_URL no soportada: {url}')
+
+class Versions:
+    """
+    Per-table version counters kept in the cache backend.
+    """
+    def __init__(self, backend):
+        self.backend = backend
+
+    def get(self, tables):
+        return self.backend.counters([f'version:{table}' for table in tables])
+
+    def bump(self, tables):
+        for table in tables:
+            self.backend.incr(f'version:{table}')
+
+class HitStats:
+    """
+    Hit/miss counters of one cache layer, read by the metrics endpoint.
+    """
+    def __init__(self):
+        self.counts = {'hit': 0, 'miss': 0}
+        self._lock = threading.Lock()
+
+    def record(self, hit):
+        with self._lock:
+            self.counts['hit' if hit else 'miss'] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.counts)
+
+class ResponseCache:
+    def __init__(self, maxsize=512, ttl=300):
+        self.store = LRUCache(maxsize, ttl)
+        self.versions = Versions(MemoryBackend())
+        self.enabled = True
+        self.stats = HitStats()
+
+    def init_app(self, app, backend):
+        self.store.maxsize = app.config.get('RESPONSE_CACHE_SIZE', self.store.maxsize)
+        self.store.ttl = app.config.get('RESPONSE_CACHE_TTL', self.store.ttl)
+        self.enabled = app.config.get('RESPONSE_CACHE_ENABLED', True)
+        self.versions = Versions(backend)
+
+    def cached(self, *models):
+        """
+        Caches the response of a GET view that reads `models` (model classes or
+        association tables). When the request uses `?expand=` the response
+        depends on related tables too, so the entry is tied to every table of
+        the schema.
+        """
+        tables = [getattr(model, '__table__', model) for model in models]
+
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return view(*args, **kwargs)
+
+                if request.args.get('expand'):
+                    names = sorted(tables[0].metadata.tables)
+                else:
+                    names = sorted(table.name for table in tables)
+                key = (
+                    request.path,
+                    tuple(sorted(request.args.items(multi=True))),
+                    request.headers.get('Accept', ''),
+                    tuple(self.versions.get(names)),
+                    read_source(),
+                )
+                entry = self.store.get(key)
+                self.stats.record(entry is not None)
+                if entry is None:
+                    response = view(*args, **kwargs)
+                    if isinstance(response, tuple) or response.status_code != 200 or response.is_streamed:
+                        return response
+                    body = response.get_data()
+                    entry = {
+                        'body': body,
+                        'mimetype': response.mimetype,
+                        'headers': [(k, v) for k, v in response.headers if k == 'Link'],
+                        'etag': response.get_etag()[0] or hashlib.sha1(body).hexdigest(),
+                        'last_modified': datetime.now(timezone.utc).replace(microsecond=0),
+                    }
+                    self.store.set(key, entry, cache_ttl(self.store.ttl))
+
+                response = Response(entry['body'], mimetype=entry['mimetype'], headers=entry['headers'])
+                response.set_etag(entry['etag'])
+                response.last_modified = entry['last_modified']
+                return response.make_conditional(request)
+            return wrapper
+        return decorator
+
+class EntityCache:
+    """
+    Serialized single entities stored in the (possibly shared) backend under
+    versioned keys: entity:<table>:v<version>:<primary|replica>:<id>.
+    """
+    def __init__(self, ttl=300):
+        self.backend = MemoryBackend()
+        self.versions = Versions(self.backend)
+        self.ttl = ttl
+        self.enabled = True
+        self.stats = HitStats()
+
+    def init_app(self, app, backend):
+        self.backend = backend
+        self.versions = Versions(backend)
+        self.ttl = app.config.get('ENTITY_CACHE_TTL', self.ttl)
+        self.enabled = app.config.get('ENTITY_CACHE_ENABLED', True)
+
+    def _key(self, model, pk):
+        table = model.__table__.name
+        version, = self.versions.get([table])
+        return f'entity:{table}:v{version}:{read_source()}:{pk}'
+
+    def get_json(self, model, pk, load):
+        """
+        Returns the JSON text of entity `pk`, calling `load(pk)` to build the
+        dict on a miss.
+        """
+        if not self.enabled:
+            return current_app.json.dumps(load(pk))
+        key = self._key(model, pk)
+        body = self.backend.get(key)
+        self.stats.record(body is not None)
+        if body is None:
+            body = current_app.json.dumps(load(pk))
+            self.backend.set(key, body.encode(), cache_ttl(self.ttl))
+            return body
+        return body.decode() if isinstance(body, bytes) else body
+
+response_cache = ResponseCache()
+entity_cache = EntityCache()
+
+def init_cache(app):
+    backend = make_backend(app.config.get('CACHE_URL'))
+    response_cache.init_app(app, backend)
+    entity_cache.init_app(app, backend)
+
+def _touched(session):
+    return session.info.setdefault('touched_tables', set())
+
+@event.listens_for(Session, 'after_flush')
+def _track_flush(session, flush_context):
+    touched = _touched(session)
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        state = inspect(obj)
+        touched.add(state.mapper.local_table.name)
+        for relationship in state.mapper.relationships:
+            if relationship.secondary is None:
+                continue
+            if obj in session.deleted or state.attrs[relationship.key].history.has_changes():
+                touched.add(relationship.secondary.name)
+
+@event.listens_for(Session, 'do_orm_execute')
+def _track_statement(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        # a statement can name the tables whose readers it affects instead of the
+        # one it writes (e.g. derived counters that no cached entity shows)
+        tables = orm_execute_state.execution_options.get('cache_tables')
+        if tables is None:
+            tables = (orm_execute_state.statement.table.name,)
+        _touched(orm_execute_state.session).update(tables)
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_on_commit(session):
+    touched = session.info.pop('touched_tables', None)
+    if touched:
+        response_cache.versions.bump(sorted(touched))
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_on_rollback(session):
+    session.info.pop('touched_tables', None)
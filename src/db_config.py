@@ -0,0 +1,80 @@
+"""
+Database engine configuration from environment variables.
+
+    DB_POOL_MODE            internal (default) or external: with an external
+                            pooler such as pgbouncer the app keeps no pool (NullPool)
+    DB_POOL_SIZE            connections kept open per process (default 5)
+    DB_MAX_OVERFLOW         extra connections allowed under bursts (default 5)
+    DB_POOL_TIMEOUT         seconds to wait for a free connection (default 10)
+    DB_POOL_RECYCLE         seconds after which a connection is replaced (default 1800)
+    DB_POOL_PRE_PING        test connections on checkout (default true)
+    DB_STATEMENT_TIMEOUT_MS per statement timeout on Postgres (default 0, none)
+
+SQLite keeps the Flask-SQLAlchemy defaults.
+"""
+import os
+import threading
+from sqlalchemy import event
+from sqlalchemy.pool import NullPool
+
+def _flag(value):
+    return str(value).lower() in ('1', 'true', 'yes', 'on')
+
+def engine_options(url, env=os.environ):
+    if url.startswith('sqlite'):
+        return {}
+
+    options = {'pool_pre_ping': _flag(env.get('DB_POOL_PRE_PING', 'true'))}
+    if env.get('DB_POOL_MODE', 'internal') == 'external':
+        options['poolclass'] = NullPool
+    else:
+        options.update(
+            pool_size=int(env.get('DB_POOL_SIZE', 5)),
+            max_overflow=int(env.get('DB_MAX_OVERFLOW', 5)),
+            pool_timeout=int(env.get('DB_POOL_TIMEOUT', 10)),
+            pool_recycle=int(env.get('DB_POOL_RECYCLE', 1800)),
+            # reuse the most recent connection so idle ones can be recycled away
+            pool_use_lifo=True,
+        )
+
+    timeout = int(env.get('DB_STATEMENT_TIMEOUT_MS', 0))
+    if timeout and url.startswith('postgresql'):
+        options['connect_args'] = {'options': f'-c statement_timeout={timeout}'}
+    return options
+
+class PoolStats:
+    """
+    Counters of pool events for one engine, plus its current occupancy.
+    """
+    EVENTS = ('connect', 'checkout', 'checkin', 'invalidate')
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.counts = dict.fromkeys(self.EVENTS, 0)
+        self._lock = threading.Lock()
+        for name in self.EVENTS:
+            event.listen(engine, name, self._counter(name))
+
+    def _counter(self, name):
+        def listener(*args):
+            with self._lock:
+                self.counts[name] += 1
+        return listener
+
+    def snapshot(self):
+        pool = self.engine.pool
+        data = {'pool': type(pool).__name__, **self.counts}
+        for name in ('size', 'checkedin', 'checkedout', 'overflow'):
+            if hasattr(pool, name):
+                data[name] = getattr(pool, name)()
+        return data
+
+pool_stats = {}
+
+def instrument_pools(app, db):
+    """
+    Attaches PoolStats to every engine of the app; call after db.init_app.
+    """
+    with app.app_context():
+        for key, engine in db.engines.items():
+            pool_stats[key or 'default'] = PoolStats(engine)
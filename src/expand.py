@@ -0,0 +1,51 @@
+"""
+Support for the `?expand=` query parameter: embeds related objects in the
+response, loading every relationship with one batched IN query (selectinload)
+instead of one query per item.
+"""
+from sqlalchemy.orm import selectinload
+from utils import APIException
+
+MAX_EXPAND_DEPTH = 2
+
+def parse_expand(model, raw):
+    """
+    Turns "films,films.planets,starships" into a tree like
+    {'films': {'planets': {}}, 'starships': {}}, validating every name
+    against the relationships of the model.
+    """
+    tree = {}
+    for path in (raw or '').split(','):
+        path = path.strip()
+        if not path:
+            continue
+        parts = path.split('.')
+        if len(parts) > MAX_EXPAND_DEPTH:
+            raise APIException(f'expand admite como máximo {MAX_EXPAND_DEPTH} niveles: {path}', status_code=400)
+        node, current = tree, model
+        for part in parts:
+            relationship = current.__mapper__.relationships.get(part)
+            if relationship is None or not hasattr(relationship.mapper.class_, 'to_dict'):
+                raise APIException(f'No se puede expandir {part} en {current.__name__}', status_code=400)
+            node = node.setdefault(part, {})
+            current = relationship.mapper.class_
+    return tree
+
+def expand_options(model, tree):
+    options = []
+    for name, subtree in tree.items():
+        relationship = model.__mapper__.relationships[name]
+        loader = selectinload(getattr(model, name))
+        if subtree:
+            loader = loader.options(*expand_options(relationship.mapper.class_, subtree))
+        options.append(loader)
+    return options
+
+def serialize_expanded(obj, tree, fields=None):
+    if fields is None:
+        data = obj.to_dict()
+    else:
+        data = {name: getattr(obj, name) for name in fields}
+    for name, subtree in tree.items():
+        data[name] = [serialize_expanded(related, subtree) for related in getattr(obj, name)]
+    return data
@@ -0,0 +1,58 @@
+"""
+`flask check-indexes`: runs EXPLAIN on the statements the relationship loaders
+issue against the association tables (WHERE <parent column> IN (...), as
+selectinload and lazy loading do) and fails if any of them has to scan the
+table instead of seeking an index. Meant to run in CI after the migrations.
+"""
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import select, text
+from models import db
+
+def loader_statements():
+    """
+    One statement per relationship with a secondary table, filtering on the
+    column that points at the parent of the relationship.
+    """
+    for mapper in db.Model.registry.mappers:
+        for relationship in mapper.relationships:
+            if relationship.secondary is None:
+                continue
+            secondary = relationship.secondary
+            column = next(
+                c for c in secondary.columns
+                if any(fk.references(mapper.local_table) for fk in c.foreign_keys)
+            )
+            statement = select(secondary).where(column.in_([1, 2, 3]))
+            yield f'{mapper.class_.__name__}.{relationship.key}', secondary.name, statement
+
+def plan(connection, statement):
+    sql = str(statement.compile(dialect=connection.dialect, compile_kwargs={'literal_binds': True}))
+    if connection.dialect.name == 'sqlite':
+        return [row[-1] for row in connection.execute(text(f'EXPLAIN QUERY PLAN {sql}'))]
+    return [row[0] for row in connection.execute(text(f'EXPLAIN {sql}'))]
+
+def uses_index(lines, table):
+    for line in lines:
+        if line.startswith(f'SCAN {table}') or f'Seq Scan on {table}' in line:
+            return False
+    return any('INDEX' in line.upper() for line in lines)
+
+@click.command('check-indexes')
+@with_appcontext
+def check_indexes():
+    """Checks that every relationship loader is served by an index."""
+    connection = db.session.connection()
+    if connection.dialect.name == 'postgresql':
+        # tiny tables make the planner prefer a seq scan; ask whether an index could be used
+        connection.execute(text('SET LOCAL enable_seqscan = off'))
+
+    failures = 0
+    for name, table, statement in loader_statements():
+        lines = plan(connection, statement)
+        ok = uses_index(lines, table)
+        failures += not ok
+        click.echo(f"{'OK  ' if ok else 'SCAN'} {name:<28} {' | '.join(lines)}")
+    db.session.rollback()
+    if failures:
+        raise click.ClickException(f'{failures} relaciones sin índice')
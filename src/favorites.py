@@ -0,0 +1,92 @@
+"""
+Denormalized favorite counters: Planet.favorite_count and
+People.favorite_count hold how many users have each entity as a favorite.
+
+The favorites handlers update them in the same transaction as the association
+rows (`bump_favorite_counts`), so the leaderboard is a backward scan of the
+(favorite_count, id) index instead of a GROUP BY over the association tables.
+`flask reconcile-favorites` recounts them from the association tables to
+repair any drift (e.g. rows written outside the API).
+"""
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import select, update, delete, func
+from models import db, Planet, People, user_favorites_planets, user_favorites_people
+
+# model, association table, column pointing at the model
+FAVORITE_COLLECTIONS = {
+    'planets': (Planet, user_favorites_planets, 'planet_id'),
+    'people': (People, user_favorites_people, 'people_id'),
+}
+
+def counter_options(model):
+    """
+    Execution options of the statements writing favorite_count. The column is
+    internal, so they invalidate what reads the favorites table (the
+    leaderboard) instead of every cached planet or person.
+    """
+    table = next(table for counted, table, _ in FAVORITE_COLLECTIONS.values() if counted is model)
+    return {'synchronize_session': False, 'cache_tables': (table.name,)}
+
+def bump_favorite_counts(model, ids, delta):
+    """Adds `delta` to the counter of every id, in one UPDATE."""
+    if not ids or not delta:
+        return
+    db.session.execute(
+        update(model).where(model.id.in_(ids)).values(favorite_count=model.favorite_count + delta),
+        execution_options=counter_options(model),
+    )
+
+def delete_favorites(table, column, user_id, ids):
+    """
+    Deletes the favorites `ids` of `user_id` and returns the ids whose row
+    was actually deleted (from RETURNING, or one DELETE per id where the
+    dialect cannot return), so concurrent requests never count a row twice.
+    """
+    target = table.c[column]
+    stmt = delete(table).where(table.c.user_id == user_id)
+    if db.session.get_bind().dialect.delete_returning:
+        return db.session.execute(stmt.where(target.in_(ids)).returning(target)).scalars().all()
+    return [pk for pk in ids if db.session.execute(stmt.where(target == pk)).rowcount]
+
+def leaderboard_statement(model, limit):
+    return (select(model.id, model.name, model.favorite_count)
+            .where(model.favorite_count > 0)
+            .order_by(model.favorite_count.desc(), model.id.desc())
+            .limit(limit))
+
+def actual_count(model, table, column):
+    return (select(func.count()).select_from(table)
+            .where(table.c[column] == model.id)
+            .scalar_subquery())
+
+def recount_favorites():
+    """Sets every counter from the favorites tables (after bulk loads)."""
+    for model, table, column in FAVORITE_COLLECTIONS.values():
+        db.session.execute(
+            update(model).values(favorite_count=actual_count(model, table, column)),
+            execution_options=counter_options(model),
+        )
+
+@click.command('reconcile-favorites')
+@click.option('--dry-run', is_flag=True, help='Solo muestra las diferencias.')
+@with_appcontext
+def reconcile_favorites(dry_run):
+    """Recounts favorite_count from the favorites tables."""
+    for name, (model, table, column) in FAVORITE_COLLECTIONS.items():
+        count = actual_count(model, table, column)
+        drifted = db.session.execute(
+            select(model.id, model.favorite_count, count).where(model.favorite_count != count)
+        ).all()
+        for pk, stored, actual in drifted[:20]:
+            click.echo(f'  {name} {pk}: {stored} -> {actual}')
+        if drifted and not dry_run:
+            db.session.execute(
+                update(model).where(model.favorite_count != count).values(favorite_count=count),
+                execution_options=counter_options(model),
+            )
+        click.echo(f'{name}: {len(drifted)} contadores {"desfasados" if dry_run else "corregidos"}')
+    if dry_run:
+        db.session.rollback()
+    else:
+        db.session.commit()
@@ -0,0 +1,25 @@
+"""
+Support for the `?fields=` sparse fieldset parameter. The projection is pushed
+down into the SELECT so only the requested columns are read and serialized.
+"""
+from utils import APIException
+from serializers import serializable_fields
+
+def parse_fields(model, raw):
+    """
+    Turns "name,population" into the list of column names to select, always
+    starting with `id` (it is the pagination cursor). Returns None when the
+    client wants every field.
+    """
+    if not raw:
+        return None
+    columns = serializable_fields(model)
+    fields = ['id']
+    for name in raw.split(','):
+        name = name.strip()
+        if not name or name in fields:
+            continue
+        if name not in columns:
+            raise APIException(f'Campo desconocido en {model.__name__}: {name}', status_code=400)
+        fields.append(name)
+    return fields
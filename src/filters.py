@@ -0,0 +1,113 @@
+"""
+Query string filters and sorting for the list endpoints, translated into SQL
+expressions:
+
+    ?name=Luke%20Skywalker              eq
+    ?gender_in=male,female              in
+    ?name_prefix=Sky                    prefix
+    ?population_gt=1000000              range (gt, gte, lt, lte)
+    ?sort=-mass,name                    sort keys, "-" for descending
+
+Only indexed columns can be filtered or sorted on (the primary key, columns
+leading an index or a unique constraint, and the numeric shadow columns of
+NumericShadowMixin, which stand in for their string measurement); anything
+else is rejected with a 400 instead of turning into a full table scan.
+"""
+import operator
+from sqlalchemy import and_, Integer, Float, Numeric, DateTime, Date, UniqueConstraint
+from utils import APIException
+from serializers import serializable_fields, parse_datetime
+
+RESERVED_PARAMS = {'limit', 'after', 'fields', 'expand', 'sort', 'stream', 'ids'}
+
+RANGE_OPERATORS = {
+    'gt': operator.gt,
+    'gte': operator.ge,
+    'lt': operator.lt,
+    'lte': operator.le,
+}
+OPERATORS = set(RANGE_OPERATORS) | {'in', 'prefix'}
+MAX_IN_VALUES = 100
+
+def numeric_column(model, name):
+    if name in getattr(model, 'numeric_fields', ()):
+        return getattr(model, f'{name}_num')
+    return None
+
+def indexed_columns(model):
+    """
+    Names of the columns a B-tree can seek on: the primary key and the leading
+    column of every index and unique constraint.
+    """
+    table = model.__table__
+    names = {column.name for column in table.primary_key.columns}
+    for index in table.indexes:
+        names.add(list(index.columns)[0].name)
+    for constraint in table.constraints:
+        if isinstance(constraint, UniqueConstraint) and constraint.columns:
+            names.add(list(constraint.columns)[0].name)
+    return names
+
+def filter_column(model, name):
+    column = numeric_column(model, name)
+    if column is not None:
+        return column
+    if name not in serializable_fields(model):
+        raise APIException(f'Campo desconocido en {model.__name__}: {name}', status_code=400)
+    if name not in indexed_columns(model):
+        raise APIException(f'{model.__name__}.{name} no tiene índice; no se puede filtrar ni ordenar por ese campo', status_code=400)
+    return getattr(model, name)
+
+def coerce(column, raw, key):
+    try:
+        if isinstance(column.type, (Float, Numeric)):
+            return float(raw)
+        if isinstance(column.type, Integer):
+            return int(raw)
+        if isinstance(column.type, (DateTime, Date)):
+            return parse_datetime(raw)
+    except ValueError:
+        raise APIException(f'Valor inválido para {key}: {raw}', status_code=400)
+    return raw
+
+def split_key(model, key):
+    name, _, op = key.rpartition('_')
+    if name and op in OPERATORS and (numeric_column(model, name) is not None or name in serializable_fields(model)):
+        return name, op
+    return key, 'eq'
+
+def apply_filters(model, query, args):
+    conditions = []
+    for key, raw in args.items(multi=True):
+        if key in RESERVED_PARAMS or key.startswith('_'):
+            continue
+        name, op = split_key(model, key)
+        column = filter_column(model, name)
+        if op == 'eq':
+            conditions.append(column == coerce(column, raw, key))
+        elif op == 'in':
+            values = [value for value in raw.split(',') if value != '']
+            if not values or len(values) > MAX_IN_VALUES:
+                raise APIException(f'{key} admite entre 1 y {MAX_IN_VALUES} valores', status_code=400)
+            conditions.append(column.in_([coerce(column, value, key) for value in values]))
+        elif op == 'prefix':
+            if not isinstance(coerce(column, raw, key), str) or not raw:
+                raise APIException(f'{key} solo aplica a campos de texto', status_code=400)
+            # the range lets the B-tree seek, LIKE keeps it exact under any collation
+            conditions.append(and_(column >= raw, column < raw + '\uffff', column.startswith(raw, autoescape=True)))
+        else:
+            conditions.append(RANGE_OPERATORS[op](column, coerce(column, raw, key)))
+    return query.filter(*conditions) if conditions else query
+
+def parse_sort(model, raw):
+    """
+    Turns "-mass,name" into [(People.mass_num, True), (People.name, False)].
+    """
+    order = []
+    for key in (raw or '').split(','):
+        key = key.strip()
+        if not key:
+            continue
+        descending = key.startswith('-')
+        order.append((filter_column(model, key.lstrip('-')), descending))
+    return order
@@ -0,0 +1,129 @@
+"""
+In-memory adjacency index of the entity graph (people, films, planets,
+species, starships, vehicles), for traversals that would otherwise take
+several joins per request.
+
+Each direction of an association table is kept as two compact integer arrays
+in CSR form: `targets` holds every neighbor id grouped by source id and
+`offsets[id]:offsets[id + 1]` is the slice of the neighbors of `id`. A table
+with a million links takes a few MB.
+
+Every array is tagged with the version of its table (the counters of cache.py,
+bumped on commit by any writer, in any worker when the backend is shared). A
+traversal checks the versions first and reloads only the tables that changed,
+so writes are picked up table by table without restarting. Writes that never
+bump a counter this process sees (a per-process backend, SQL run outside the
+app) are picked up when an array gets older than GRAPH_MAX_AGE seconds.
+Arrays are loaded on first use in each process.
+"""
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from flask import abort, current_app
+from sqlalchemy import select
+from models import db
+
+class Adjacency:
+    """One direction (source column -> target column) of an association table."""
+
+    def __init__(self, offsets, targets):
+        self.offsets = offsets
+        self.targets = targets
+
+    @classmethod
+    def load(cls, connection, table, source, target):
+        source, target = table.c[source], table.c[target]
+        offsets, targets = array('q', [0]), array('i')
+        current = 0
+        for node, neighbor in connection.execute(select(source, target).order_by(source, target)):
+            while current < node:
+                offsets.append(len(targets))
+                current += 1
+            targets.append(neighbor)
+        offsets.append(len(targets))
+        return cls(offsets, targets)
+
+    def neighbors(self, node):
+        if not 0 <= node < len(self.offsets) - 1:
+            return self.targets[0:0]
+        return self.targets[self.offsets[node]:self.offsets[node + 1]]
+
+class Nodes:
+    """Sorted ids of a model, plus the name (or title) of each one."""
+
+    def __init__(self, ids, labels):
+        self.ids = ids
+        self.labels = labels
+
+    @classmethod
+    def load(cls, connection, model):
+        label = getattr(model, 'name', None) or model.title
+        rows = connection.execute(select(model.id, label).order_by(model.id)).all()
+        return cls(array('i', [row[0] for row in rows]), [row[1] for row in rows])
+
+    def __contains__(self, node):
+        index = bisect_left(self.ids, node)
+        return index < len(self.ids) and self.ids[index] == node
+
+    def describe(self, ids, field):
+        result = []
+        for node in ids:
+            index = bisect_left(self.ids, node)
+            if index < len(self.ids) and self.ids[index] == node:
+                result.append({'id': node, field: self.labels[index]})
+        return result
+
+class EntityGraph:
+    def __init__(self):
+        self._entries = {}  # key -> (version, loaded at, Adjacency | Nodes)
+        self._lock = threading.Lock()
+
+    def _fresh(self, entry, version):
+        max_age = current_app.config.get('GRAPH_MAX_AGE', 60)
+        return entry is not None and entry[0] == version and time.monotonic() - entry[1] < max_age
+
+    def _current(self, key, table_name, version, load):
+        entry = self._entries.get(key)
+        if self._fresh(entry, version):
+            return entry[2]
+        with self._lock:
+            entry = self._entries.get(key)
+            if not self._fresh(entry, version):
+                with db.engine.connect() as connection:
+                    entry = (version, time.monotonic(), load(connection))
+                self._entries[key] = entry
+        return entry[2]
+
+    def _versions(self, tables):
+        from cache import response_cache
+        return dict(zip(tables, response_cache.versions.get(tables)))
+
+    def traverse(self, model, node, hops):
+        """
+        Follows `hops` — (association table, source column, target column) —
+        from `node` and returns the sorted ids reached at the last hop.
+        Aborts with 404 when `node` does not exist.
+        """
+        versions = self._versions([model.__table__.name] + [table.name for table, _, _ in hops])
+        if node not in self.nodes(model, versions):
+            abort(404)
+        frontier = {node}
+        for table, source, target in hops:
+            adjacency = self._current((table.name, source), table.name, versions[table.name],
+                                      lambda connection: Adjacency.load(connection, table, source, target))
+            frontier = {neighbor for current in frontier for neighbor in adjacency.neighbors(current)}
+        return sorted(frontier)
+
+    def nodes(self, model, versions=None):
+        table = model.__table__.name
+        if versions is None or table not in versions:
+            versions = self._versions([table])
+        return self._current((table, None), table, versions[table],
+                             lambda connection: Nodes.load(connection, model))
+
+    def describe(self, model, ids):
+        field = 'name' if hasattr(model, 'name') else 'title'
+        return self.nodes(model).describe(ids, field)
+
+entity_graph = EntityGraph()
@@ -0,0 +1,98 @@
+"""
+Prometheus metrics served at /metrics in the text exposition format.
+
+    http_request_duration_seconds{endpoint,method}      histogram
+    http_requests_total{endpoint,method,status}         counter
+    http_response_size_bytes{endpoint}                  histogram
+    db_pool_connections{engine,state}                   gauge (size, checkedin, checkedout, overflow)
+    db_pool_events_total{engine,event}                  counter (connect, checkout, checkin, invalidate)
+    cache_requests_total{cache,result}                  counter (hit/miss of the response and entity caches)
+
+With several gunicorn workers set PROMETHEUS_MULTIPROC_DIR to an empty
+directory: every worker writes its samples there and /metrics aggregates all
+of them, whichever worker answers the scrape (gunicorn.conf.py cleans it up).
+
+Requires prometheus_client; without it /metrics answers 501.
+"""
+import os
+import time
+from flask import g, request, current_app
+from db_config import pool_stats
+from cache import response_cache, entity_cache
+
+try:
+    from prometheus_client import (Counter, Gauge, Histogram, CollectorRegistry, REGISTRY,
+                                   CONTENT_TYPE_LATEST, generate_latest, multiprocess)
+except ImportError:  # pragma: no cover - optional dependency
+    Counter = None
+
+LATENCY_BUCKETS = (.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10)
+SIZE_BUCKETS = (100, 1000, 10000, 100000, 1000000, 10000000)
+POOL_STATES = ('size', 'checkedin', 'checkedout', 'overflow')
+CACHES = {'response': response_cache, 'entity': entity_cache}
+
+if Counter is not None:
+    REQUEST_LATENCY = Histogram('http_request_duration_seconds', 'Request latency by endpoint',
+                                ['endpoint', 'method'], buckets=LATENCY_BUCKETS)
+    REQUESTS = Counter('http_requests_total', 'Requests by endpoint and status', ['endpoint', 'method', 'status'])
+    RESPONSE_SIZE = Histogram('http_response_size_bytes', 'Response body size by endpoint',
+                              ['endpoint'], buckets=SIZE_BUCKETS)
+    POOL_CONNECTIONS = Gauge('db_pool_connections', 'Connections of the SQLAlchemy pools',
+                             ['engine', 'state'], multiprocess_mode='livesum')
+    POOL_EVENTS = Counter('db_pool_events_total', 'SQLAlchemy pool events', ['engine', 'event'])
+    CACHE_REQUESTS = Counter('cache_requests_total', 'Cache lookups by result', ['cache', 'result'])
+
+# counter values already exported by this process, to add only the difference
+_exported = {}
+
+def _export_delta(counter, labels, value):
+    delta = value - _exported.get((counter, labels), 0)
+    if delta > 0:
+        counter.labels(*labels).inc(delta)
+        _exported[(counter, labels)] = value
+
+def sync_counters():
+    """
+    Copies the pool and cache counters of this process into the metrics.
+    """
+    for engine, stats in pool_stats.items():
+        snapshot = stats.snapshot()
+        for name in POOL_STATES:
+            if name in snapshot:
+                POOL_CONNECTIONS.labels(engine, name).set(snapshot[name])
+        for name in stats.EVENTS:
+            _export_delta(POOL_EVENTS, (engine, name), snapshot[name])
+    for name, cache in CACHES.items():
+        for result, value in cache.stats.snapshot().items():
+            _export_delta(CACHE_REQUESTS, (name, result), value)
+
+def _start_timer():
+    g.request_start = time.perf_counter()
+
+def _record(response):
+    endpoint = request.endpoint or 'unmatched'
+    start = g.get('request_start')
+    if start is not None:
+        REQUEST_LATENCY.labels(endpoint, request.method).observe(time.perf_counter() - start)
+    REQUESTS.labels(endpoint, request.method, str(response.status_code)).inc()
+    size = response.calculate_content_length()
+    if size is not None:
+        RESPONSE_SIZE.labels(endpoint).observe(size)
+    sync_counters()
+    return response
+
+def metrics_response():
+    if Counter is None:
+        return {'message': 'prometheus_client no está instalado'}, 501
+    sync_counters()
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return current_app.response_class(generate_latest(registry), content_type=CONTENT_TYPE_LATEST)
+
+def init_metrics(app):
+    if Counter is not None:
+        app.before_request(_start_timer)
+        app.after_request(_record)
@@ -1,62 +1,165 @@
+import re
 from flask_sqlalchemy import SQLAlchemy
-from datetime import datetime
-
-db = SQLAlchemy()
+from sqlalchemy import event, inspect
+from sqlalchemy.dialects import postgresql, sqlite
+from datetime import datetime, timedelta, timezone
+from serializers import SerializerMixin
+from routing import RoutingSession
+
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+
+def insert_ignore(table, rows, returning=None):
+    """
+    Inserts rows into `table` skipping the ones that already exist
+    (INSERT ... ON CONFLICT DO NOTHING / INSERT IGNORE).
+    Returns the number of rows actually inserted or, given a column name in
+    `returning`, that column of every row actually inserted (from RETURNING,
+    or one INSERT per row where the dialect cannot return).
+    """
+    dialect = db.session.get_bind().dialect
+    if dialect.name == 'postgresql':
+        stmt = postgresql.insert(table).on_conflict_do_nothing()
+    elif dialect.name == 'sqlite':
+        stmt = sqlite.insert(table).on_conflict_do_nothing()
+    elif dialect.name in ('mysql', 'mariadb'):
+        stmt = table.insert().prefix_with('IGNORE')
+    else:
+        stmt = table.insert()
+    if returning is None:
+        return db.session.execute(stmt, rows).rowcount
+    if dialect.name in ('postgresql', 'sqlite') and dialect.insert_returning:
+        return db.session.execute(stmt.values(rows).returning(table.c[returning])).scalars().all()
+    return [row[returning] for row in rows if db.session.execute(stmt, row).rowcount]
+
+NUMBER = re.compile(r'^-?\d+(\.\d+)?$')
+
+def parse_number(value):
+    """
+    SWAPI measurements are strings such as "1,358", "200000", "1000km",
+    "unknown" or "n/a". Returns the number, or None when there is none.
+    """
+    if value is None:
+        return None
+    text = str(value).strip().lower().replace(',', '')
+    if text.endswith('km'):
+        text = text[:-2].strip()
+    if not NUMBER.match(text):
+        return None
+    return float(text)
+
+class NumericShadowMixin:
+    """
+    Every column named in `numeric_fields` has an indexed Float copy called
+    `<field>_num`, kept in sync on every write, so range filters and sorts on
+    measurements run in SQL.
+    """
+    numeric_fields = ()
+
+    @classmethod
+    def shadow_values(cls, values):
+        return {f'{name}_num': parse_number(values.get(name)) for name in cls.numeric_fields if name in values}
+
+@event.listens_for(NumericShadowMixin, 'before_insert', propagate=True)
+@event.listens_for(NumericShadowMixin, 'before_update', propagate=True)
+def _sync_numeric_shadows(mapper, connection, target):
+    for name in target.numeric_fields:
+        setattr(target, f'{name}_num', parse_number(getattr(target, name)))
+
+def next_edited(previous=None):
+    """
+    New `edited` value for a row whose current one is `previous`: now (UTC),
+    but always later than `previous` so every write yields a new version.
+    """
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    if previous is None:
+        return now
+    return max(now, previous.replace(tzinfo=None) + timedelta(microseconds=1))
+
+@event.listens_for(db.Model, 'before_update', propagate=True)
+def _touch_edited(mapper, connection, target):
+    # las ediciones por el ORM (p. ej. Flask-Admin) también cambian la versión
+    # que comparan los If-Match de PATCH/PUT, salvo que fijen `edited` ellas mismas
+    if 'edited' not in mapper.columns:
+        return
+    state = inspect(target)
+    if state.attrs.edited.history.has_changes() or not state.session.is_modified(target, include_collections=False):
+        return
+    target.edited = next_edited(target.edited)
+
+def numeric_column():
+    return db.Column(db.Float, index=True, info={'internal': True})
+
+def favorite_count_column():
+    # contador desnormalizado de user_favorites_*, lo mantienen los handlers de favoritos
+    return db.Column(db.Integer, nullable=False, default=0, server_default='0', info={'internal': True})
 
 # Definir las tablas intermedias primero
+# Cada una lleva un índice inverso: la clave primaria compuesta solo sirve
+# las búsquedas por su primera columna
 user_favorites_planets = db.Table('user_favorites_planets',
     db.Column('user_id', db.Integer, db.ForeignKey('user.id'), primary_key=True),
-    db.Column('planet_id', db.Integer, db.ForeignKey('planet.id'), primary_key=True)
+    db.Column('planet_id', db.Integer, db.ForeignKey('planet.id'), primary_key=True),
+    db.Index('ix_user_favorites_planets_planet_id', 'planet_id', 'user_id')
 )
 
 user_favorites_people = db.Table('user_favorites_people',
     db.Column('user_id', db.Integer, db.ForeignKey('user.id'), primary_key=True),
-    db.Column('people_id', db.Integer, db.ForeignKey('people.id'), primary_key=True)
+    db.Column('people_id', db.Integer, db.ForeignKey('people.id'), primary_key=True),
+    db.Index('ix_user_favorites_people_people_id', 'people_id', 'user_id')
 )
 
 people_films = db.Table('people_films',
     db.Column('people_id', db.Integer, db.ForeignKey('people.id'), primary_key=True),
-    db.Column('film_id', db.Integer, db.ForeignKey('film.id'), primary_key=True)
+    db.Column('film_id', db.Integer, db.ForeignKey('film.id'), primary_key=True),
+    db.Index('ix_people_films_film_id', 'film_id', 'people_id')
 )
 
 species_people = db.Table('species_people',
     db.Column('species_id', db.Integer, db.ForeignKey('species.id'), primary_key=True),
-    db.Column('people_id', db.Integer, db.ForeignKey('people.id'), primary_key=True)
+    db.Column('people_id', db.Integer, db.ForeignKey('people.id'), primary_key=True),
+    db.Index('ix_species_people_people_id', 'people_id', 'species_id')
 )
 
 people_starships = db.Table('people_starships',
     db.Column('people_id', db.Integer, db.ForeignKey('people.id'), primary_key=True),
-    db.Column('starship_id', db.Integer, db.ForeignKey('starship.id'), primary_key=True)
+    db.Column('starship_id', db.Integer, db.ForeignKey('starship.id'), primary_key=True),
+    db.Index('ix_people_starships_starship_id', 'starship_id', 'people_id')
 )
 
 people_vehicles = db.Table('people_vehicles',
     db.Column('people_id', db.Integer, db.ForeignKey('people.id'), primary_key=True),
-    db.Column('vehicle_id', db.Integer, db.ForeignKey('vehicle.id'), primary_key=True)
+    db.Column('vehicle_id', db.Integer, db.ForeignKey('vehicle.id'), primary_key=True),
+    db.Index('ix_people_vehicles_vehicle_id', 'vehicle_id', 'people_id')
 )
 
 planets_people = db.Table('planets_people',
     db.Column('planet_id', db.Integer, db.ForeignKey('planet.id'), primary_key=True),
-    db.Column('people_id', db.Integer, db.ForeignKey('people.id'), primary_key=True)
+    db.Column('people_id', db.Integer, db.ForeignKey('people.id'), primary_key=True),
+    db.Index('ix_planets_people_people_id', 'people_id', 'planet_id')
 )
 
 species_films = db.Table('species_films',
     db.Column('species_id', db.Integer, db.ForeignKey('species.id'), primary_key=True),
-    db.Column('film_id', db.Integer, db.ForeignKey('film.id'), primary_key=True)
+    db.Column('film_id', db.Integer, db.ForeignKey('film.id'), primary_key=True),
+    db.Index('ix_species_films_film_id', 'film_id', 'species_id')
 )
 
 starships_films = db.Table('starships_films',
     db.Column('starship_id', db.Integer, db.ForeignKey('starship.id'), primary_key=True),
-    db.Column('film_id', db.Integer, db.ForeignKey('film.id'), primary_key=True)
+    db.Column('film_id', db.Integer, db.ForeignKey('film.id'), primary_key=True),
+    db.Index('ix_starships_films_film_id', 'film_id', 'starship_id')
 )
 
 vehicles_films = db.Table('vehicles_films',
     db.Column('vehicle_id', db.Integer, db.ForeignKey('vehicle.id'), primary_key=True),
-    db.Column('film_id', db.Integer, db.ForeignKey('film.id'), primary_key=True)
+    db.Column('film_id', db.Integer, db.ForeignKey('film.id'), primary_key=True),
+    db.Index('ix_vehicles_films_film_id', 'film_id', 'vehicle_id')
 )
 
 planets_films = db.Table('planets_films',
     db.Column('planet_id', db.Integer, db.ForeignKey('planet.id'), primary_key=True),
-    db.Column('film_id', db.Integer, db.ForeignKey('film.id'), primary_key=True)
+    db.Column('film_id', db.Integer, db.ForeignKey('film.id'), primary_key=True),
+    db.Index('ix_planets_films_film_id', 'film_id', 'planet_id')
 )
 
 # Definir los modelos
@@ -71,11 +174,13 @@ class User(db.Model):
     def __repr__(self):
         return f'<User {self.email}>'
 
-class People(db.Model):
+class People(SerializerMixin, NumericShadowMixin, db.Model):
     __tablename__ = 'people'
+    # el ranking recorre este índice hacia atrás: ORDER BY favorite_count DESC, id DESC
+    __table_args__ = (db.Index('ix_people_favorite_count', 'favorite_count', 'id'),)
 
     id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String(250), nullable=False)
+    name = db.Column(db.String(250), nullable=False, index=True)
     birth_year = db.Column(db.String(50))
     eye_color = db.Column(db.String(50))
     gender = db.Column(db.String(50))
@@ -88,34 +193,23 @@ class People(db.Model):
     edited = db.Column(db.DateTime)
     image = db.Column(db.String(250), nullable=True)
 
+    numeric_fields = ('height', 'mass')
+    height_num = numeric_column()
+    mass_num = numeric_column()
+    favorite_count = favorite_count_column()
+
     films = db.relationship('Film', secondary=people_films)
     starships = db.relationship('Starship', secondary=people_starships)
     vehicles = db.relationship('Vehicle', secondary=people_vehicles)
     species = db.relationship('Species', secondary=species_people)
     planets = db.relationship('Planet', secondary=planets_people)
 
-    def to_dict(self):
-        return {
-            'id': self.id,
-            'name': self.name,
-            'birth_year': self.birth_year,
-            'eye_color': self.eye_color,
-            'gender': self.gender,
-            'hair_color': self.hair_color,
-            'height': self.height,
-            'mass': self.mass,
-            'skin_color': self.skin_color,
-            'homeworld': self.homeworld,
-            'created': self.created,
-            'edited': self.edited,
-        }
-
-class Film(db.Model):
+class Film(SerializerMixin, db.Model):
     __tablename__ = 'film'
 
     id = db.Column(db.Integer, primary_key=True)
-    title = db.Column(db.String(250), nullable=False)
-    episode_id = db.Column(db.Integer, nullable=False)
+    title = db.Column(db.String(250), nullable=False, index=True)
+    episode_id = db.Column(db.Integer, nullable=False, index=True)
     opening_crawl = db.Column(db.String)
     director = db.Column(db.String(250))
     producer = db.Column(db.String(250))
@@ -128,24 +222,11 @@ class Film(db.Model):
     vehicles = db.relationship('Vehicle', secondary=vehicles_films)
     planets = db.relationship('Planet', secondary=planets_films)
 
-    def to_dict(self):
-        return {
-            'id': self.id,
-            'title': self.title,
-            'episode_id': self.episode_id,
-            'opening_crawl': self.opening_crawl,
-            'director': self.director,
-            'producer': self.producer,
-            'release_date': self.release_date,
-            'created': self.created,
-            'edited': self.edited,
-        }
-
-class Starship(db.Model):
+class Starship(SerializerMixin, NumericShadowMixin, db.Model):
     __tablename__ = 'starship'
 
     id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String(250), nullable=False)
+    name = db.Column(db.String(250), nullable=False, index=True)
     model = db.Column(db.String(250))
     starship_class = db.Column(db.String(250))
     manufacturer = db.Column(db.String(250))
@@ -161,34 +242,21 @@ class Starship(db.Model):
     created = db.Column(db.DateTime)
     edited = db.Column(db.DateTime)
 
+    numeric_fields = ('cost_in_credits', 'length', 'max_atmosphering_speed', 'hyperdrive_rating', 'cargo_capacity')
+    cost_in_credits_num = numeric_column()
+    length_num = numeric_column()
+    max_atmosphering_speed_num = numeric_column()
+    hyperdrive_rating_num = numeric_column()
+    cargo_capacity_num = numeric_column()
+
     films = db.relationship('Film', secondary=starships_films)
     pilots = db.relationship('People', secondary=people_starships)
 
-    def to_dict(self):
-        return {
-            'id': self.id,
-            'name': self.name,
-            'model': self.model,
-            'starship_class': self.starship_class,
-            'manufacturer': self.manufacturer,
-            'cost_in_credits': self.cost_in_credits,
-            'length': self.length,
-            'crew': self.crew,
-            'passengers': self.passengers,
-            'max_atmosphering_speed': self.max_atmosphering_speed,
-            'hyperdrive_rating': self.hyperdrive_rating,
-            'MGLT': self.MGLT,
-            'cargo_capacity': self.cargo_capacity,
-            'consumables': self.consumbales,
-            'created': self.created,
-            'edited': self.edited,
-        }
-
-class Vehicle(db.Model):
+class Vehicle(SerializerMixin, NumericShadowMixin, db.Model):
     __tablename__ = 'vehicle'
 
     id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String(250), nullable=False)
+    name = db.Column(db.String(250), nullable=False, index=True)
     model = db.Column(db.String(250))
     vehicle_class = db.Column(db.String(250))
     manufacturer = db.Column(db.String(250))
@@ -203,32 +271,20 @@ class Vehicle(db.Model):
     edited = db.Column(db.DateTime)
     image = db.Column(db.String(250), nullable=True)
 
+    numeric_fields = ('cost_in_credits', 'length', 'max_atmosphering_speed', 'cargo_capacity')
+    cost_in_credits_num = numeric_column()
+    length_num = numeric_column()
+    max_atmosphering_speed_num = numeric_column()
+    cargo_capacity_num = numeric_column()
+
     films = db.relationship('Film', secondary=vehicles_films)
     pilots = db.relationship('People', secondary=people_vehicles)
 
-    def to_dict(self):
-        return {
-            'id': self.id,
-            'name': self.name,
-            'model': self.model,
-            'vehicle_class': self.vehicle_class,
-            'manufacturer': self.manufacturer,
-            'length': self.length,
-            'cost_in_credits': self.cost_in_credits,
-            'crew': self.crew,
-            'passengers': self.passengers,
-            'max_atmosphering_speed': self.max_atmosphering_speed,
-            'cargo_capacity': self.cargo_capacity,
-            'consumables': self.consumables,
-            'created': self.created,
-            'edited': self.edited,
-        }
-
-class Species(db.Model):
+class Species(SerializerMixin, NumericShadowMixin, db.Model):
     __tablename__ = 'species'
 
     id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String(250), nullable=False)
+    name = db.Column(db.String(250), nullable=False, index=True)
     classification = db.Column(db.String(250))
     designation = db.Column(db.String(250))
     average_height = db.Column(db.String(50))
@@ -241,31 +297,19 @@ class Species(db.Model):
     created = db.Column(db.DateTime)
     edited = db.Column(db.DateTime)
 
+    numeric_fields = ('average_height', 'average_lifespan')
+    average_height_num = numeric_column()
+    average_lifespan_num = numeric_column()
+
     people = db.relationship('People', secondary=species_people)
     films = db.relationship('Film', secondary=species_films)
 
-    def to_dict(self):
-        return {
-            'id': self.id,
-            'name': self.name,
-            'classification': self.classification,
-            'designation': self.designation,
-            'average_height': self.average_height,
-            'average_lifespan': self.average_lifespan,
-            'eye_colors': self.eye_colors,
-            'hair_colors': self.hair_colors,
-            'skin_colors': self.skin_colors,
-            'language': self.language,
-            'homeworld': self.homeworld,
-            'created': self.created,
-            'edited': self.edited,
-        }
-
-class Planet(db.Model):
+class Planet(SerializerMixin, NumericShadowMixin, db.Model):
     __tablename__ = 'planet'
+    __table_args__ = (db.Index('ix_planet_favorite_count', 'favorite_count', 'id'),)
 
     id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String(250), nullable=False)
+    name = db.Column(db.String(250), nullable=False, index=True)
     diameter = db.Column(db.String(50))
     rotation_period = db.Column(db.String(50))
     orbital_period = db.Column(db.String(50))
@@ -278,21 +322,13 @@ class Planet(db.Model):
     edited = db.Column(db.DateTime)
     image = db.Column(db.String(250), nullable=True)
 
+    numeric_fields = ('diameter', 'rotation_period', 'orbital_period', 'population', 'surface_water')
+    diameter_num = numeric_column()
+    rotation_period_num = numeric_column()
+    orbital_period_num = numeric_column()
+    population_num = numeric_column()
+    surface_water_num = numeric_column()
+    favorite_count = favorite_count_column()
+
     residents = db.relationship('People', secondary=planets_people)
-    films = db.relationship('Film', secondary=planets_films)
-
-    def to_dict(self):
-        return {
-            'id': self.id,
-            'name': self.name,
-            'diameter': self.diameter,
-            'rotation_period': self.rotation_period,
-            'orbital_period': self.orbital_period,
-            'gravity': self.gravity,
-            'population': self.population,
-            'climate': self.climate,
-            'terrain': self.terrain,
-            'surface_water': self.surface_water,
-            'created': self.created,
-            'edited': self.edited,
-        }
\ No newline at end of file
+    films = db.relationship('Film', secondary=planets_films)
\ No newline at end of file
@@ -0,0 +1,99 @@
+"""
+Per-request SQL instrumentation built on SQLAlchemy engine events.
+
+Every statement executed while handling a request is counted and timed. The
+totals are returned in a `Server-Timing` header (visible in the browser dev
+tools), and the slowest statements are logged at DEBUG level on the
+`query_stats` logger.
+
+Query budget (N+1 guard): QUERY_BUDGET sets the maximum number of statements
+per request (0 disables it) and `@query_budget(n)` overrides it for a route.
+Going over the budget raises QueryBudgetExceeded when the app is in testing
+mode, so the test fails, and logs a warning otherwise.
+
+Statements run by a streamed response body happen after the response is
+finalized and are not counted.
+"""
+import heapq
+import logging
+import time
+from functools import wraps
+from flask import g, has_request_context, current_app, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger('query_stats')
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+class QueryStats:
+    def __init__(self, keep=3):
+        self.count = 0
+        self.total = 0.0
+        self.keep = keep
+        self.slowest = []  # min-heap of (duration, statement)
+
+    def add(self, statement, duration):
+        self.count += 1
+        self.total += duration
+        entry = (duration, self.count, statement)
+        if len(self.slowest) < self.keep:
+            heapq.heappush(self.slowest, entry)
+        elif duration > self.slowest[0][0]:
+            heapq.heapreplace(self.slowest, entry)
+
+    def top(self):
+        return [(duration, statement) for duration, _, statement in sorted(self.slowest, reverse=True)]
+
+def current_stats():
+    if not has_request_context():
+        return None
+    stats = g.get('query_stats')
+    if stats is None:
+        stats = g.query_stats = QueryStats(current_app.config.get('QUERY_STATS_SLOWEST', 3))
+    return stats
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    duration = time.perf_counter() - conn.info['query_start'].pop()
+    stats = current_stats()
+    if stats is not None:
+        stats.add(statement, duration)
+
+def query_budget(limit):
+    """
+    Maximum number of SQL statements for one route, overriding QUERY_BUDGET.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            g.query_budget = limit
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def _report(response):
+    stats = g.get('query_stats') or QueryStats()
+    response.headers.add('Server-Timing', f'db;dur={stats.total * 1000:.1f};desc="{stats.count} queries"')
+
+    if logger.isEnabledFor(logging.DEBUG) and stats.count:
+        slowest = '; '.join(f'{duration * 1000:.1f}ms {" ".join(statement.split())[:200]}'
+                            for duration, statement in stats.top())
+        logger.debug('%s %s: %d queries in %.1fms, slowest: %s',
+                     request.method, request.path, stats.count, stats.total * 1000, slowest)
+
+    budget = g.get('query_budget', current_app.config.get('QUERY_BUDGET', 0))
+    if budget and stats.count > budget:
+        message = f'{request.method} {request.path} ran {stats.count} queries, budget is {budget}'
+        if current_app.testing:
+            raise QueryBudgetExceeded(message)
+        logger.warning(message)
+    return response
+
+def init_query_stats(app):
+    app.after_request(_report)
@@ -0,0 +1,131 @@
+"""
+Read replica routing.
+
+When DATABASE_REPLICA_URLS is set, each replica becomes a Flask-SQLAlchemy
+bind and `RoutingSession` sends the statements of GET/HEAD requests to one of
+them (round robin, one replica per request so a request sees a single
+snapshot). Everything else, flushes and commits included, goes to the primary.
+
+Read-your-writes: after a write the client is pinned to the primary for
+READ_YOUR_WRITES_SECONDS, through a cookie and, for the `user_id` based
+favorites routes, through a key in the shared cache backend so it holds for
+every worker and for clients that ignore cookies. The caches key their
+entries by `read_source()`, so what a replica returned is never served to a
+pinned client.
+"""
+import itertools
+import time
+from functools import wraps
+from flask import request, g, has_request_context, current_app
+from flask_sqlalchemy.session import Session
+
+STICKY_COOKIE = 'read_primary_until'
+REPLICA_PREFIX = 'replica_'
+
+_round_robin = itertools.count()
+
+def replica_binds(urls):
+    return {f'{REPLICA_PREFIX}{index}': url for index, url in enumerate(urls)}
+
+def _sticky_store():
+    from cache import entity_cache
+    return entity_cache.backend
+
+def mark_user_sticky(user_id):
+    """
+    Pins reads for `user_id` to the primary for a while after a write.
+    """
+    if not current_app.config.get('REPLICA_BINDS'):
+        return
+    seconds = current_app.config.get('READ_YOUR_WRITES_SECONDS', 5)
+    _sticky_store().set(f'sticky:user:{user_id}', b'1', seconds)
+    g.read_from_primary = True
+
+def request_user_id():
+    """
+    The user a request acts for: the `user_id` of the URL, else ?user_id=,
+    else user 1 (placeholder until there is authentication).
+    """
+    user_id = (request.view_args or {}).get('user_id')
+    if user_id is None:
+        user_id = request.args.get('user_id', type=int, default=1)
+    return user_id
+
+def _pinned_to_primary():
+    if g.get('read_from_primary'):
+        return True
+    until = request.cookies.get(STICKY_COOKIE, type=float)
+    if until is not None and until > time.time():
+        return True
+    return _sticky_store().get(f'sticky:user:{request_user_id()}') is not None
+
+def reads_only(view):
+    """
+    Marks a non-GET view that only reads (e.g. POST /batch) so it can be
+    served by a replica and does not pin the client to the primary.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        g.reads_only = True
+        return view(*args, **kwargs)
+    return wrapper
+
+def _reading():
+    return request.method in ('GET', 'HEAD') or g.get('reads_only', False)
+
+def cache_ttl(ttl):
+    """
+    TTL for something about to be cached. Data read from a replica may lag
+    behind the primary, so it is kept only for READ_YOUR_WRITES_SECONDS.
+    """
+    if has_request_context() and g.get('replica'):
+        return min(ttl, current_app.config.get('READ_YOUR_WRITES_SECONDS', 5))
+    return ttl
+
+def request_replica():
+    """
+    The replica the reads of this request go to, or None for the primary.
+    Decided once, on first use, and kept in `g` for the whole request: one
+    stickiness check per request and a single snapshot for all its reads.
+    """
+    if 'replica' not in g:
+        replicas = current_app.config.get('REPLICA_BINDS')
+        if replicas and not _pinned_to_primary():
+            g.replica = replicas[next(_round_robin) % len(replicas)]
+        else:
+            g.replica = None
+    return g.replica
+
+def read_source():
+    """
+    'replica' or 'primary', where the reads of this request come from. Part of
+    every cache key, so an entry filled from a lagging replica is never
+    served to a client pinned to the primary after its write.
+    """
+    if has_request_context() and request_replica() is not None:
+        return 'replica'
+    return 'primary'
+
+class RoutingSession(Session):
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and has_request_context() and _reading():
+            replica = request_replica()
+            if replica is not None:
+                return self._db.engines[replica]
+        return super().get_bind(mapper, clause=clause, bind=bind, **kwargs)
+
+def init_replicas(app, urls):
+    """
+    Registers the replicas as binds; call before db.init_app.
+    """
+    binds = replica_binds(urls)
+    app.config.setdefault('SQLALCHEMY_BINDS', {}).update(binds)
+    app.config['REPLICA_BINDS'] = sorted(binds)
+    app.config.setdefault('READ_YOUR_WRITES_SECONDS', 5)
+
+    @app.after_request
+    def pin_writers_to_primary(response):
+        if request.method != 'OPTIONS' and not _reading() and response.status_code < 400:
+            seconds = app.config['READ_YOUR_WRITES_SECONDS']
+            response.set_cookie(STICKY_COOKIE, str(time.time() + seconds), max_age=seconds, httponly=True)
+        return response
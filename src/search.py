@@ -0,0 +1,193 @@
+"""
+Full-text search over the Star Wars entities.
+
+The inverted index lives in the database: an FTS5 virtual table on SQLite and
+a table with a GIN-indexed tsvector on Postgres. It is created by the
+migrations (or `flask search-reindex`), maintained incrementally on every ORM
+flush and by the bulk write paths, and queried by the /search endpoint with
+ranked, paginated results.
+"""
+import re
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import event, inspect, text, select
+from sqlalchemy.orm import Session
+from models import db, People, Film, Starship, Vehicle, Species, Planet
+from utils import APIException
+
+SEARCH_TABLE = 'search_index'
+
+# entity type -> (model, indexed fields)
+SEARCHABLE = {
+    'people': (People, ('name',)),
+    'planets': (Planet, ('name', 'climate', 'terrain')),
+    'films': (Film, ('title', 'opening_crawl', 'director', 'producer')),
+    'species': (Species, ('name', 'classification', 'designation', 'language')),
+    'starships': (Starship, ('name', 'model', 'manufacturer', 'starship_class')),
+    'vehicles': (Vehicle, ('name', 'model', 'manufacturer', 'vehicle_class')),
+}
+ENTITY_BY_MODEL = {model: entity for entity, (model, fields) in SEARCHABLE.items()}
+# rowid = id * ROWID_STRIDE + code keeps one FTS5 row per entity addressable by rowid
+ENTITY_CODES = {entity: code for code, entity in enumerate(SEARCHABLE)}
+ROWID_STRIDE = 8
+
+WORD = re.compile(r'\w+', re.UNICODE)
+MAX_TERMS = 8
+
+class SQLiteIndex:
+    def create(self, connection):
+        connection.exec_driver_sql(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5("
+            "entity UNINDEXED, entity_id UNINDEXED, content, tokenize='unicode61 remove_diacritics 2')"
+        )
+
+    def _rowid(self, entity, pk):
+        return pk * ROWID_STRIDE + ENTITY_CODES[entity]
+
+    def delete(self, connection, keys):
+        if keys:
+            connection.execute(text(f'DELETE FROM {SEARCH_TABLE} WHERE rowid = :rowid'),
+                               [{'rowid': self._rowid(entity, pk)} for entity, pk in keys])
+
+    def upsert(self, connection, documents):
+        if not documents:
+            return
+        self.delete(connection, [(entity, pk) for entity, pk, content in documents])
+        connection.execute(
+            text(f'INSERT INTO {SEARCH_TABLE} (rowid, entity, entity_id, content) VALUES (:rowid, :entity, :pk, :content)'),
+            [{'rowid': self._rowid(entity, pk), 'entity': entity, 'pk': pk, 'content': content}
+             for entity, pk, content in documents]
+        )
+
+    def clear(self, connection):
+        connection.exec_driver_sql(f'DELETE FROM {SEARCH_TABLE}')
+
+    def search(self, connection, terms, entities, limit, offset):
+        match = ' '.join(f'"{term}"*' for term in terms)
+        placeholders = ', '.join(f':e{i}' for i in range(len(entities)))
+        return connection.execute(text(
+            f'SELECT entity, entity_id, -bm25({SEARCH_TABLE}) AS score FROM {SEARCH_TABLE} '
+            f'WHERE {SEARCH_TABLE} MATCH :match AND entity IN ({placeholders}) '
+            f'ORDER BY bm25({SEARCH_TABLE}), rowid LIMIT :limit OFFSET :offset'
+        ), {'match': match, 'limit': limit, 'offset': offset,
+            **{f'e{i}': entity for i, entity in enumerate(entities)}}).all()
+
+class PostgresIndex:
+    CONFIG = 'english'
+
+    def create(self, connection):
+        connection.exec_driver_sql(
+            f'CREATE TABLE IF NOT EXISTS {SEARCH_TABLE} ('
+            'entity VARCHAR(20) NOT NULL, entity_id INTEGER NOT NULL, document TSVECTOR NOT NULL, '
+            'PRIMARY KEY (entity, entity_id))'
+        )
+        connection.exec_driver_sql(
+            f'CREATE INDEX IF NOT EXISTS ix_{SEARCH_TABLE}_document ON {SEARCH_TABLE} USING GIN (document)'
+        )
+
+    def delete(self, connection, keys):
+        if keys:
+            connection.execute(text(f'DELETE FROM {SEARCH_TABLE} WHERE entity = :entity AND entity_id = :pk'),
+                               [{'entity': entity, 'pk': pk} for entity, pk in keys])
+
+    def upsert(self, connection, documents):
+        if not documents:
+            return
+        connection.execute(text(
+            f'INSERT INTO {SEARCH_TABLE} (entity, entity_id, document) '
+            f"VALUES (:entity, :pk, to_tsvector('{self.CONFIG}', :content)) "
+            'ON CONFLICT (entity, entity_id) DO UPDATE SET document = EXCLUDED.document'
+        ), [{'entity': entity, 'pk': pk, 'content': content} for entity, pk, content in documents])
+
+    def clear(self, connection):
+        connection.exec_driver_sql(f'DELETE FROM {SEARCH_TABLE}')
+
+    def search(self, connection, terms, entities, limit, offset):
+        query = ' & '.join(f'{term}:*' for term in terms)
+        return connection.execute(text(
+            f"SELECT entity, entity_id, ts_rank(document, to_tsquery('{self.CONFIG}', :query)) AS score "
+            f"FROM {SEARCH_TABLE} WHERE document @@ to_tsquery('{self.CONFIG}', :query) "
+            'AND entity = ANY(:entities) ORDER BY score DESC, entity, entity_id LIMIT :limit OFFSET :offset'
+        ), {'query': query, 'entities': list(entities), 'limit': limit, 'offset': offset}).all()
+
+BACKENDS = {'sqlite': SQLiteIndex(), 'postgresql': PostgresIndex()}
+_available = {}
+
+def backend_for(connection):
+    return BACKENDS.get(connection.dialect.name)
+
+def index_available(connection):
+    """
+    Whether the connection's database has a search index. Checked once per
+    engine, so writes keep working on databases that were never migrated.
+    """
+    key = connection.engine.url
+    if key not in _available:
+        _available[key] = backend_for(connection) is not None and inspect(connection).has_table(SEARCH_TABLE)
+    return _available[key]
+
+def document(obj):
+    entity = ENTITY_BY_MODEL[type(obj)]
+    fields = SEARCHABLE[entity][1]
+    return entity, obj.id, ' '.join(getattr(obj, name) or '' for name in fields)
+
+def indexed_fields(model):
+    return SEARCHABLE[ENTITY_BY_MODEL[model]][1]
+
+def reindex_ids(connection, model, ids):
+    """
+    Refreshes the documents of `ids`; used by the bulk paths that write with
+    core statements and so never reach the flush hook.
+    """
+    if not ids or not index_available(connection):
+        return
+    entity = ENTITY_BY_MODEL[model]
+    fields = SEARCHABLE[entity][1]
+    columns = [model.id] + [getattr(model, name) for name in fields]
+    rows = connection.execute(select(*columns).where(model.id.in_(ids))).all()
+    backend_for(connection).upsert(connection, [
+        (entity, row[0], ' '.join(value or '' for value in row[1:])) for row in rows
+    ])
+
+def rebuild(connection):
+    backend = backend_for(connection)
+    backend.create(connection)
+    _available[connection.engine.url] = True
+    backend.clear(connection)
+    for entity, (model, fields) in SEARCHABLE.items():
+        ids = connection.execute(select(model.id)).scalars().all()
+        for start in range(0, len(ids), 1000):
+            reindex_ids(connection, model, ids[start:start + 1000])
+
+def search(connection, q, entities, limit, offset):
+    terms = WORD.findall(q.lower())[:MAX_TERMS]
+    if not terms:
+        raise APIException('q debe contener al menos una palabra', status_code=400)
+    backend = backend_for(connection)
+    if backend is None or not index_available(connection):
+        raise APIException('La búsqueda no está disponible en esta base de datos', status_code=503)
+    return backend.search(connection, terms, entities, limit, offset)
+
+@event.listens_for(Session, 'after_flush')
+def _index_flush(session, flush_context):
+    changed = [obj for obj in list(session.new) + list(session.dirty) if type(obj) in ENTITY_BY_MODEL]
+    deleted = [obj for obj in session.deleted if type(obj) in ENTITY_BY_MODEL]
+    if not changed and not deleted:
+        return
+    connection = session.connection()
+    if not index_available(connection):
+        return
+    backend = backend_for(connection)
+    backend.upsert(connection, [document(obj) for obj in changed])
+    backend.delete(connection, [(ENTITY_BY_MODEL[type(obj)], obj.id) for obj in deleted])
+
+@click.command('search-reindex')
+@with_appcontext
+def search_reindex():
+    """Creates the search index if needed and rebuilds it from scratch."""
+    connection = db.session.connection()
+    if backend_for(connection) is None:
+        raise click.ClickException(f'Búsqueda no soportada en {connection.dialect.name}')
+    rebuild(connection)
+    db.session.commit()
+    click.echo('Índice de búsqueda reconstruido')
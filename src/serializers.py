@@ -0,0 +1,172 @@
+"""
+Fast serialization path.
+
+Instead of building every dict by hand in each `to_dict()`, an encoder function
+is generated once per model from its SQLAlchemy column metadata and reused for
+every row. Dates are always encoded as ISO 8601. When `orjson` is installed the
+app uses it as its JSON provider.
+"""
+from datetime import date, datetime
+from functools import lru_cache
+from flask.json.provider import DefaultJSONProvider, JSONProvider
+from sqlalchemy import Boolean, Date, DateTime, Integer, Numeric, String
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+HIDDEN_FIELDS = ('password',)
+LEGACY_DATE_FORMAT = "%a, %d %b %Y %H:%M:%S GMT"
+# column type -> JSON types it accepts, and how the error names it
+JSON_TYPES = (
+    (Boolean, (bool,), 'un booleano'),
+    (Integer, (int,), 'un entero'),
+    (Numeric, (int, float), 'un número'),
+    (String, (str,), 'un texto'),
+)
+
+def _iso(value):
+    return value.isoformat() if value is not None else None
+
+def _compile(model, fields, by_position):
+    columns = model.__mapper__.column_attrs
+    items = []
+    for position, name in enumerate(fields):
+        access = f'obj[{position}]' if by_position else f'obj.{name}'
+        if isinstance(columns[name].columns[0].type, (DateTime, Date)):
+            access = f'_iso({access})'
+        items.append(f'{name!r}: {access}')
+    source = f"def encode_{model.__name__}(obj):\n    return {{{', '.join(items)}}}\n"
+    namespace = {'_iso': _iso}
+    exec(compile(source, f'<encoder {model.__name__}>', 'exec'), namespace)
+    return namespace[f'encode_{model.__name__}']
+
+def serializable_fields(model):
+    """
+    Public columns of a model: everything but HIDDEN_FIELDS and the columns
+    flagged with info={'internal': True} (e.g. the numeric shadow columns).
+    """
+    return tuple(
+        attr.key for attr in model.__mapper__.column_attrs
+        if attr.key not in HIDDEN_FIELDS and not attr.columns[0].info.get('internal')
+    )
+
+@lru_cache(maxsize=None)
+def encoder_for(model):
+    """
+    Returns a function turning an instance of `model` into a dict of all its
+    public columns.
+    """
+    return _compile(model, serializable_fields(model), by_position=False)
+
+@lru_cache(maxsize=None)
+def row_encoder_for(model, fields):
+    """
+    Returns a function turning a row tuple selected as `fields` (in that
+    order) into a dict.
+    """
+    return _compile(model, fields, by_position=True)
+
+class SerializerMixin:
+    def to_dict(self):
+        return encoder_for(type(self))(self)
+
+def parse_datetime(value):
+    """
+    Parses ISO 8601 dates, and the RFC 822 format the API used to return.
+    """
+    if value is None:
+        return None
+    try:
+        return datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        return datetime.strptime(value, LEGACY_DATE_FORMAT)
+
+def check_type(name, column, value):
+    """
+    Raises ValueError unless `value` (not null) fits the type of `column`, so
+    a bad item is reported before it reaches the database.
+    """
+    for column_type, accepted, label in JSON_TYPES:
+        if not isinstance(column.type, column_type):
+            continue
+        if not isinstance(value, accepted) or (isinstance(value, bool) and bool not in accepted):
+            raise ValueError(f'Tipo inválido para {name}: se esperaba {label}')
+        length = getattr(column.type, 'length', None)
+        if isinstance(value, str) and length and len(value) > length:
+            raise ValueError(f'{name} admite como máximo {length} caracteres')
+        return
+
+def deserialize(model, data, partial=False, include_hidden=False):
+    """
+    Validates a JSON object for `model` and returns the column values to
+    insert. Unknown keys are ignored, like the single-object POST handlers do;
+    values must match the type of their column. With `partial` (PATCH) only
+    the keys present are validated and returned. HIDDEN_FIELDS are accepted
+    only with `include_hidden` (the SWAPI importer loading users).
+    Raises ValueError with a message for the client.
+    """
+    if not isinstance(data, dict):
+        raise ValueError('Los datos deben ser un objeto JSON.')
+    columns = model.__mapper__.column_attrs
+    fields = serializable_fields(model)
+    if include_hidden:
+        fields += tuple(name for name in HIDDEN_FIELDS if name in columns)
+    values = {}
+    for name in fields:
+        if name == 'id' or name not in data:
+            continue
+        column = columns[name].columns[0]
+        value = data[name]
+        if value is None:
+            pass
+        elif isinstance(column.type, (DateTime, Date)):
+            try:
+                value = parse_datetime(value)
+            except (AttributeError, TypeError, ValueError):
+                raise ValueError(f'Formato de fecha inválido: {name}')
+        else:
+            check_type(name, column, value)
+        values[name] = value
+    for name in fields:  # columns left out on purpose are never required
+        column = columns[name].columns[0]
+        if partial and name not in values:
+            continue
+        if not column.nullable and not column.primary_key and column.default is None and values.get(name) is None:
+            raise ValueError(f'Campo requerido faltante: {name}')
+    if hasattr(model, 'shadow_values'):
+        values.update(model.shadow_values(values))
+    return values
+
+def _default(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return DefaultJSONProvider.default(value)
+
+class ISOJSONProvider(DefaultJSONProvider):
+    default = staticmethod(_default)
+
+class ORJSONProvider(JSONProvider):
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=_default, option=orjson.OPT_NON_STR_KEYS).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        body = orjson.dumps(obj, default=_default, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_APPEND_NEWLINE)
+        return self._app.response_class(body, mimetype='application/json')
+
+def init_json(app):
+    """
+    JSON_PROVIDER can be 'orjson', 'default' or 'auto' (orjson when installed).
+    """
+    choice = app.config.get('JSON_PROVIDER', 'auto')
+    if choice == 'orjson' and orjson is None:
+        raise RuntimeError('JSON_PROVIDER=orjson pero el paquete orjson no está instalado')
+    if choice == 'orjson' or (choice == 'auto' and orjson is not None):
+        app.json = ORJSONProvider(app)
+    else:
+        app.json = ISOJSONProvider(app)
@@ -0,0 +1,185 @@
+"""
+`flask import-swapi <dir>`: loads a local SWAPI dump into the database.
+
+Accepts, per resource, either a dump of the API (`people.json` holding a list
+of objects or a `{"results": [...]}` page, with `url` fields and URL references)
+or the fixtures of the SWAPI project (`{"model", "pk", "fields"}` objects with
+integer references, plus `transport.json` for the fields starships and vehicles
+share). References are resolved to ids in memory and every table, association
+tables included, is written with bulk core INSERTs in a single transaction.
+"""
+import json
+import os
+import re
+import time
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import delete, insert, text
+from models import (db, User, People, Film, Starship, Vehicle, Species, Planet,
+                    people_films, species_people, people_starships, people_vehicles, planets_people,
+                    species_films, starships_films, vehicles_films, planets_films)
+from serializers import deserialize
+import search
+
+CHUNK_SIZE = 1000
+
+RESOURCES = [
+    ('planets', Planet),
+    ('films', Film),
+    ('species', Species),
+    ('people', People),
+    ('starships', Starship),
+    ('vehicles', Vehicle),
+    ('users', User),
+]
+
+# (resource, field, association table, column of the resource, column of the reference)
+LINKS = [
+    ('people', 'films', people_films, 'people_id', 'film_id'),
+    ('films', 'characters', people_films, 'film_id', 'people_id'),
+    ('people', 'species', species_people, 'people_id', 'species_id'),
+    ('species', 'people', species_people, 'species_id', 'people_id'),
+    ('people', 'starships', people_starships, 'people_id', 'starship_id'),
+    ('starships', 'pilots', people_starships, 'starship_id', 'people_id'),
+    ('people', 'vehicles', people_vehicles, 'people_id', 'vehicle_id'),
+    ('vehicles', 'pilots', people_vehicles, 'vehicle_id', 'people_id'),
+    ('planets', 'residents', planets_people, 'planet_id', 'people_id'),
+    ('people', 'homeworld', planets_people, 'people_id', 'planet_id'),
+    ('species', 'films', species_films, 'species_id', 'film_id'),
+    ('films', 'species', species_films, 'film_id', 'species_id'),
+    ('starships', 'films', starships_films, 'starship_id', 'film_id'),
+    ('films', 'starships', starships_films, 'film_id', 'starship_id'),
+    ('vehicles', 'films', vehicles_films, 'vehicle_id', 'film_id'),
+    ('films', 'vehicles', vehicles_films, 'film_id', 'vehicle_id'),
+    ('planets', 'films', planets_films, 'planet_id', 'film_id'),
+    ('films', 'planets', planets_films, 'film_id', 'planet_id'),
+]
+
+URL_ID = re.compile(r'/(\d+)/?$')
+
+def ref_id(value):
+    """
+    Resolves a reference (an integer pk or a SWAPI URL) to an id.
+    """
+    if value is None or value == '':
+        return None
+    if isinstance(value, int):
+        return value
+    match = URL_ID.search(str(value))
+    if match is None:
+        raise click.ClickException(f'Referencia no reconocida: {value}')
+    return int(match.group(1))
+
+def load_items(path):
+    with open(path) as f:
+        data = json.load(f)
+    if isinstance(data, dict):
+        data = data.get('results', [])
+    items = {}
+    for position, entry in enumerate(data, start=1):
+        if 'fields' in entry:
+            pk, fields = entry['pk'], dict(entry['fields'])
+        else:
+            fields = dict(entry)
+            pk = ref_id(fields.get('url')) if fields.get('url') else fields.get('id', position)
+        items[int(pk)] = fields
+    return items
+
+def read_dump(directory):
+    dump = {}
+    for resource, model in RESOURCES:
+        path = os.path.join(directory, f'{resource}.json')
+        if os.path.exists(path):
+            dump[resource] = load_items(path)
+    transport_path = os.path.join(directory, 'transport.json')
+    if os.path.exists(transport_path):
+        transport = load_items(transport_path)
+        for resource in ('starships', 'vehicles'):
+            for pk, fields in dump.get(resource, {}).items():
+                dump[resource][pk] = {**transport.get(pk, {}), **fields}
+    return dump
+
+def build_rows(dump):
+    rows = {}
+    for resource, model in RESOURCES:
+        rows[resource] = []
+        for pk, fields in dump.get(resource, {}).items():
+            if 'homeworld' in fields and fields['homeworld'] is not None:
+                fields = {**fields, 'homeworld': str(fields['homeworld'])}
+            try:
+                values = deserialize(model, fields, include_hidden=model is User)
+            except ValueError as e:
+                raise click.ClickException(f'{resource} {pk}: {e}')
+            values['id'] = pk
+            rows[resource].append(values)
+
+    links = {}
+    for resource, field, table, own_column, ref_column in LINKS:
+        pairs = links.setdefault(table.name, (table, set()))[1]
+        for pk, fields in dump.get(resource, {}).items():
+            references = fields.get(field) or []
+            if not isinstance(references, list):
+                references = [references]
+            for reference in references:
+                target = ref_id(reference)
+                if target is not None:
+                    pairs.add(tuple(sorted(((own_column, pk), (ref_column, target)))))
+    association_rows = {
+        name: (table, [dict(pair) for pair in sorted(pairs)])
+        for name, (table, pairs) in links.items()
+    }
+    return rows, association_rows
+
+def bulk_insert(table, rows):
+    for start in range(0, len(rows), CHUNK_SIZE):
+        db.session.execute(insert(table), rows[start:start + CHUNK_SIZE])
+
+def reset_sequences():
+    if db.session.get_bind().dialect.name != 'postgresql':
+        return
+    for resource, model in RESOURCES:
+        table = model.__table__.name
+        db.session.execute(text(
+            f"SELECT setval(pg_get_serial_sequence('\"{table}\"', 'id'), COALESCE(MAX(id), 1)) FROM \"{table}\""
+        ))
+
+@click.command('import-swapi')
+@click.argument('directory', type=click.Path(exists=True, file_okay=False))
+@click.option('--replace', is_flag=True, help='Borra los datos existentes antes de importar.')
+@with_appcontext
+def import_swapi(directory, replace):
+    """Imports the SWAPI JSON dump found in DIRECTORY."""
+    started = time.perf_counter()
+    rows, association_rows = build_rows(read_dump(directory))
+    click.echo(f'Dump leído y resuelto en {time.perf_counter() - started:.2f}s')
+
+    total = 0
+    try:
+        if replace:
+            # users are only wiped when the dump brings its own
+            for table in reversed(db.metadata.sorted_tables):
+                if table.name != User.__table__.name or rows['users']:
+                    db.session.execute(delete(table))
+
+        steps = [(model.__table__, rows[resource]) for resource, model in RESOURCES]
+        steps += list(association_rows.values())
+        for table, table_rows in steps:
+            if not table_rows:
+                continue
+            step_started = time.perf_counter()
+            bulk_insert(table, table_rows)
+            elapsed = time.perf_counter() - step_started
+            total += len(table_rows)
+            click.echo(f'  {table.name:<24}{len(table_rows):>8} filas  {len(table_rows) / max(elapsed, 1e-9):>12,.0f} filas/s')
+
+        reset_sequences()
+        connection = db.session.connection()
+        if search.index_available(connection):
+            search.rebuild(connection)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    elapsed = time.perf_counter() - started
+    click.echo(f'{total} filas importadas en {elapsed:.2f}s ({total / max(elapsed, 1e-9):,.0f} filas/s)')
@@ -1,4 +1,14 @@
-from flask import jsonify, url_for
+import base64
+import json
+from datetime import datetime
+from flask import jsonify, url_for, request, current_app, Response, stream_with_context
+from sqlalchemy import and_, or_
+
+DEFAULT_PAGE_LIMIT = 50
+MAX_PAGE_LIMIT = 500
+STREAM_BATCH_SIZE = 1000
+MAX_BATCH_IDS = 100
+NDJSON_MIMETYPE = 'application/x-ndjson'
 
 class APIException(Exception):
     status_code = 400
@@ -15,6 +25,159 @@ class APIException(Exception):
         rv['message'] = self.message
         return rv
 
+def get_keyset_args():
+    """
+    Reads the `limit` and `after` cursor from the query string.
+    Returns (None, None) when the client did not ask for a page.
+    """
+    if 'limit' not in request.args and 'after' not in request.args:
+        return None, None
+
+    limit = request.args.get('limit', type=int, default=DEFAULT_PAGE_LIMIT)
+    if limit is None or limit < 1 or limit > MAX_PAGE_LIMIT:
+        raise APIException(f'limit debe estar entre 1 y {MAX_PAGE_LIMIT}', status_code=400)
+    return limit, request.args.get('after')
+
+def sort_clauses(order):
+    return [(column.desc() if descending else column.asc()).nulls_last() for column, descending in order]
+
+def encode_cursor(row, key_column, order):
+    if not order:
+        return getattr(row, key_column.key)
+    values = [getattr(row, column.key) for column, _ in order] + [getattr(row, key_column.key)]
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip('=')
+
+def decode_cursor(raw, order):
+    try:
+        if not order:
+            return [int(raw)]
+        values = json.loads(base64.urlsafe_b64decode(raw + '=' * (-len(raw) % 4)))
+    except ValueError:
+        values = None
+    if not isinstance(values, list) or len(values) != len(order) + 1:
+        raise APIException('Cursor after inválido', status_code=400)
+    return values
+
+def after_cursor(key_column, order, values):
+    """
+    WHERE clause selecting the rows that come after `values` in the ordering
+    `order` + key_column, with NULLs last.
+    """
+    *sort_values, last_key = values
+    clauses, equal = [], []
+    for (column, descending), value in zip(order, sort_values):
+        if value is None:
+            equal.append(column.is_(None))
+            continue
+        beyond = column < value if descending else column > value
+        clauses.append(and_(*equal, or_(beyond, column.is_(None))))
+        equal.append(column == value)
+    clauses.append(and_(*equal, key_column > last_key))
+    return or_(*clauses)
+
+def keyset_paginate(query, key_column, limit, after=None, order=()):
+    """
+    Seeks past the `after` cursor instead of using OFFSET, so every page costs
+    the same no matter how deep the client has scrolled. `order` holds extra
+    (column, descending) sort keys applied before the unique key column; the
+    cursor is then an opaque token carrying the values of the last row.
+    Returns the rows of the page and the cursor of the next one (or None).
+    """
+    if after is not None:
+        query = query.filter(after_cursor(key_column, order, decode_cursor(after, order)))
+    rows = query.order_by(*sort_clauses(order), key_column).limit(limit + 1).all()
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(rows[-1], key_column, order)
+
+def page_response(results, next_cursor, limit):
+    response = jsonify({
+        'results': results,
+        'count': len(results),
+        'next': next_cursor,
+    })
+    if next_cursor is not None:
+        args = request.args.to_dict()
+        args.update(limit=limit, after=next_cursor)
+        next_url = url_for(request.endpoint, **request.view_args, **args)
+        response.headers['Link'] = f'<{next_url}>; rel="next"'
+    return response
+
+def parse_ids(raw, name='ids'):
+    """
+    Parses "1,4,9" into [1, 4, 9], keeping the order and any repetition.
+    """
+    try:
+        ids = [int(value) for value in raw.split(',') if value.strip()]
+    except ValueError:
+        raise APIException(f'{name} debe ser una lista de enteros separados por comas', status_code=400)
+    if not ids or len(ids) > MAX_BATCH_IDS:
+        raise APIException(f'{name} admite entre 1 y {MAX_BATCH_IDS} ids', status_code=400)
+    return ids
+
+def in_request_order(ids, rows, serialize):
+    """
+    Serializes `rows` (fetched in any order) following `ids`; an id with no
+    row gets a {"id": ..., "not_found": true} marker in its place.
+    """
+    by_id = {row.id: row for row in rows}
+    return [serialize(by_id[pk]) if pk in by_id else {'id': pk, 'not_found': True} for pk in ids]
+
+def version_etag(edited):
+    """
+    ETag of one version of an entity: its `edited` timestamp (a datetime or
+    the ISO string of its JSON), or "none" when the row has never had one.
+    """
+    if isinstance(edited, datetime):
+        edited = edited.isoformat()
+    return edited or 'none'
+
+def parse_version_etag(tag):
+    """The `edited` value a version_etag() stands for. Raises ValueError."""
+    return None if tag == 'none' else datetime.fromisoformat(tag)
+
+def wants_stream():
+    if request.args.get('stream') in ('1', 'true'):
+        return True
+    return request.accept_mimetypes.best == NDJSON_MIMETYPE
+
+def ndjson_response(query, serialize):
+    """
+    Streams a whole query as newline-delimited JSON. Rows are fetched from a
+    server side cursor in batches of STREAM_BATCH_SIZE and encoded one by one,
+    so memory use does not depend on the size of the table.
+    """
+    dumps = current_app.json.dumps
+
+    def generate():
+        for row in query.yield_per(STREAM_BATCH_SIZE):
+            yield dumps(serialize(row)) + '\n'
+
+    return Response(stream_with_context(generate()), mimetype=NDJSON_MIMETYPE)
+
+def read_json_items():
+    """
+    Reads the body of a bulk request: a JSON array, or one JSON object per
+    line when sent as application/x-ndjson (read line by line from the
+    request stream).
+    """
+    loads = current_app.json.loads
+    if request.mimetype == NDJSON_MIMETYPE:
+        items = []
+        for number, line in enumerate(request.stream, start=1):
+            if not line.strip():
+                continue
+            try:
+                items.append(loads(line))
+            except ValueError:
+                raise APIException(f'Línea {number}: JSON inválido', status_code=400)
+        return items
+    items = request.get_json(silent=True)
+    if not isinstance(items, list):
+        raise APIException('Se esperaba un arreglo JSON o NDJSON', status_code=400)
+    return items
+
 def has_no_empty_params(rule):
     defaults = rule.defaults if rule.defaults is not None else ()
     arguments = rule.arguments if rule.arguments is not None else ()